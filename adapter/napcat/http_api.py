@@ -1,5 +1,6 @@
 import httpx
 
+from infra.http import create_client
 from infra.logger import Logger
 
 
@@ -7,10 +8,10 @@ class NapCatHttpClient:
     def __init__(self, http_url, auth_token):
         self._http_url = http_url
         self._auth_token = auth_token
-        self._client = httpx.AsyncClient(base_url=http_url, headers={'Authorization': f'Bearer {auth_token}'})
+        self._client = create_client(base_url=http_url, headers={'Authorization': f'Bearer {auth_token}'})
 
     async def get_login_info(self):
-        r = await self._client.post("/get_login_info", json={})
+        r = await self._client.post("/get_login_info", json={}, extensions={"idempotent": True})
         r.raise_for_status()
         data = r.json()
         if data.get("retcode") != 0:
@@ -0,0 +1,73 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+from infra.logger import logger
+
+Entry = Tuple[int, str]
+FlushCallback = Callable[[int, List[Entry]], Awaitable[None]]
+
+
+class MessageCoalescer:
+    """
+    群消息合并器：
+        同一群连续收到的多条@消息会合并为一批，交给回调一次性处理。每条新消息后等待 quiet 秒，
+        期间没有新消息即处理，最长不超过从第一条消息起的 window 秒；
+        批次达到上限时立即处理。窗口为 0 时不合并。回调抛出的异常在两种模式下都只记录日志
+    """
+
+    def __init__(self, flush_callback: FlushCallback, window: float, max_batch: int, quiet: float = 0.3):
+        self._flush_callback = flush_callback
+        self.window = window
+        self.quiet = quiet if quiet > 0 else window
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[int, List[Entry]] = {}
+        self._deadlines: Dict[int, float] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, group_id: int, user_id: int, msg: str) -> None:
+        if self.window <= 0 or self.max_batch == 1:
+            await self._process(group_id, [(user_id, msg)])
+            return
+
+        batch = self._pending.setdefault(group_id, [])
+        batch.append((user_id, msg))
+        timer = self._timers.pop(group_id, None)
+        if timer:
+            timer.cancel()
+
+        if len(batch) >= self.max_batch:
+            # 同步取出批次，之后到达的消息进入新的批次
+            self._take(group_id)
+            self._spawn(self._process(group_id, batch))
+            return
+
+        now = asyncio.get_running_loop().time()
+        deadline = self._deadlines.setdefault(group_id, now + self.window)
+        self._timers[group_id] = self._spawn(self._flush_later(group_id, max(0.0, min(self.quiet, deadline - now))))
+
+    def _take(self, group_id: int) -> List[Entry]:
+        self._deadlines.pop(group_id, None)
+        return self._pending.pop(group_id, [])
+
+    def _spawn(self, coro: Awaitable[None]) -> asyncio.Task:
+        # 保存任务引用，避免任务在执行中被回收
+        task = asyncio.ensure_future(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    async def _flush_later(self, group_id: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._timers.pop(group_id, None)
+        self._spawn(self._process(group_id, self._take(group_id)))
+
+    async def _process(self, group_id: int, batch: List[Entry]) -> None:
+        if not batch:
+            return
+        if len(batch) > 1:
+            logger.info("Coalescer", f"群 {group_id} 合并 {len(batch)} 条消息为一次回复")
+        try:
+            await self._flush_callback(group_id, batch)
+        except Exception as e:
+            logger.warn("Coalescer", f"群 {group_id} 消息处理失败: {e}")
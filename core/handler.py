@@ -1,9 +1,15 @@
 import re
+from typing import List, Tuple
 
 from adapter.napcat.http_api import NapCatHttpClient
+from core.coalescer import MessageCoalescer
 from core.pusher.weather_scheduler import WeatherScheduler
+from infra.config.settings import settings
+from infra.http import shared_transport
 from infra.logger import logger
 from service.llm.chat import LLMService
+from service.llm.usage import usage_store
+from service.rag.service import RAGService
 from service.weather.service import WeatherService
 from service.bangumi.service import BangumiService
 from core.pusher.bangumi_scheduler import BangumiScheduler
@@ -19,12 +25,32 @@ class Handler:
         self.bangumi_svc: BangumiService = BangumiService()
         self.bangumi_scheduler: BangumiScheduler = BangumiScheduler(self.client)
         self.bilibili_scheduler: BilibiliScheduler = BilibiliScheduler(self.client)
+        self.coalescer: MessageCoalescer = MessageCoalescer(
+            self._reply_batch,
+            window=settings.CHAT_COALESCE_WINDOW,
+            max_batch=settings.CHAT_COALESCE_MAX_BATCH,
+            quiet=settings.CHAT_COALESCE_QUIET,
+        )
 
     async def reply_handler(self, group_id, msg, user_id):
+        await self.coalescer.submit(group_id, user_id, msg)
+
+    async def _reply_batch(self, group_id, messages: List[Tuple[int, str]]):
         # resp = await self.llm_svc.chat(msg)
         # resp = await self.llm_svc.chat_with_memory(msg, group_id, user_id)
-        resp = await self.llm_svc.agent_chat(msg, group_id, user_id)
-        reply: str = resp.reply
+        if len(messages) == 1:
+            user_id, msg = messages[0]
+            resp = await self.llm_svc.agent_chat(msg, group_id, user_id)
+            reply: str = resp.reply
+        else:
+            resp = await self.llm_svc.agent_chat_batch(group_id, messages)
+            # 将回复中的“@用户id”转换为真正的@
+            user_ids = {str(user_id) for user_id, _ in messages}
+            reply: str = re.sub(
+                r"@(\d+)",
+                lambda m: f"[CQ:at,qq={m.group(1)}]" if m.group(1) in user_ids else m.group(0),
+                resp.reply,
+            )
         await self.client.send_group_msg(group_id, reply)
 
     async def weather_handler(self, group_id, msg: str):
@@ -268,6 +294,68 @@ class Handler:
             logger.warn("Handler", f"检查UP主 {up_uid} 动态时出错: {e}")
             await self.client.send_group_msg(group_id, "❌ 检查动态时出现错误")
 
+    async def usage_handler(self, group_id, usage_cmd: str, user_id):
+        """
+            /用量              -> 本群今日用量（按任务）
+            /用量 [YYYY-MM-DD]  -> 本群指定日期用量
+            /用量 全部          -> 今日各群用量
+        """
+        if user_id not in settings.ADMIN_USER_IDS:
+            await self.client.send_group_msg(group_id, "⚠️ 仅管理员可以查询用量")
+            return
+
+        if usage_cmd == "全部":
+            report = usage_store.daily_report()
+            if not report:
+                await self.client.send_group_msg(group_id, "📊 今日暂无用量记录")
+                return
+            lines = [f"📊 今日各群用量（{usage_store.today()}）"]
+            for gid, item in sorted(report.items(), key=lambda kv: kv[1]["total_tokens"], reverse=True):
+                lines.append(f"• {gid}：{item['calls']} 次 / {item['total_tokens']} tokens / {item['seconds']:.1f}s")
+            await self.client.send_group_msg(group_id, "\n".join(lines))
+            return
+
+        date = usage_cmd or usage_store.today()
+        if not re.match(r"^\d{4}-\d{2}-\d{2}$", date):
+            await self.client.send_group_msg(group_id, "❌ 请输入正确的日期，例如：/用量 2025-08-03")
+            return
+
+        report = usage_store.group_report(str(group_id), date)
+        if not report:
+            await self.client.send_group_msg(group_id, f"📊 本群 {date} 暂无用量记录")
+            return
+
+        total_tokens = sum(item["total_tokens"] for item in report.values())
+        lines = [f"📊 本群 {date} 用量：共 {total_tokens} tokens"]
+        for task, item in sorted(report.items()):
+            lines.append(
+                f"• {task}：{item['calls']} 次 / 输入 {item['input_tokens']} + 输出 {item['output_tokens']} tokens"
+                f" / {item['seconds']:.1f}s"
+            )
+        budget = settings.LLM_GROUP_DAILY_TOKEN_BUDGET
+        if budget > 0 and date == usage_store.today():
+            lines.append(f"今日预算：{total_tokens}/{budget}（{usage_store.budget_level(str(group_id))}）")
+        if settings.LLM_SPECULATIVE_REPLY:
+            spec = self.llm_svc.reply_speculation.snapshot()
+            lines.append(f"回复预测：采用 {spec['wins']} 次 / 取消 {spec['losses']} 次"
+                         f"（胜率 {spec['win_rate']:.0%}，浪费 {spec['wasted_tokens']} tokens）")
+        rag = RAGService.peek_shared()
+        if rag is not None:
+            stats = rag.cache_stats()
+            lines.append(f"检索缓存：结果命中率 {stats['result']['hit_rate']:.0%}"
+                         f" / 查询向量命中率 {stats['embedding']['hit_rate']:.0%}")
+            status = rag.index_status()
+            if status["state"] != "idle":
+                lines.append(f"索引更新：{status['state']} {status['stage']} {status['done']}/{status['total']}")
+        metrics = shared_transport.metrics()
+        if metrics:
+            slowest = sorted(metrics.items(), key=lambda kv: kv[1]["p95_ms"], reverse=True)[:3]
+            lines.append("外部接口 p95：" + "，".join(f"{endpoint} {m['p95_ms']:.0f}ms" for endpoint, m in slowest))
+        open_circuits = shared_transport.open_circuits()
+        if open_circuits:
+            lines.append(f"熔断中：{'、'.join(open_circuits)}")
+        await self.client.send_group_msg(group_id, "\n".join(lines))
+
     async def help_handler(self, group_id, help_cmd: str):
         """处理帮助请求，根据指定的模块返回详细帮助信息"""
         greet_msg = (
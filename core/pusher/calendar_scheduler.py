@@ -179,14 +179,14 @@ class CalendarScheduler:
         return specials_should_filled
 
     async def _do_send(self, group_id: int, date_meta: DateMeta):
-        msg = await self._build_message(date_meta)
+        msg = await self._build_message(date_meta, str(group_id))
         if msg:
             try:
                 await self.client.send_group_msg(int(group_id), msg)
             except Exception as e:
                 logger.warn("CalenderScheduler", f"群 {group_id} 发送失败: {e}")
 
-    async def _build_message(self, date_meta) -> str:
+    async def _build_message(self, date_meta, group_id: str = None) -> str:
         now = datetime.now(tz=ZoneInfo("Asia/Shanghai"))
         lines = [f"今天是{date_meta.date.isoformat()}, 农历{date_meta.lunar_date}。", f"现在是{now.strftime('%H:%M')}。"]
 
@@ -208,7 +208,7 @@ class CalendarScheduler:
 
         content = "\n".join(lines)
 
-        msg = await self.llm.generate_greeting(content)
+        msg = await self.llm.generate_greeting(content, group_id)
         reply = msg.reply
 
         return reply
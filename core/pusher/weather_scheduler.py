@@ -139,6 +139,15 @@ class WeatherScheduler:
         self.save_warning_cache("cache/warning_cache.json")
 
     def start(self):
+        # 启动时立即预解析订阅城市，之后每天在播报前刷新过期的解析结果
+        self.scheduler.add_job(
+            self._prewarm_locations,
+            trigger="cron",
+            hour="7",
+            minute="0",
+            id="prewarm_locations",
+            next_run_time=datetime.now(tz=ZoneInfo("Asia/Shanghai")),
+        )
         self.scheduler.add_job(
             self._send_daily_forecast,
             trigger="cron",
@@ -164,6 +173,13 @@ class WeatherScheduler:
             msg = await self.push_daily_forecast(group_id)
             await self.client.send_group_msg(int(group_id), msg)
 
+    async def _prewarm_locations(self):
+        self._load_new_subscriptions()
+        cities = list(dict.fromkeys(city for cities in self.subscriptions.values() for city in cities))
+        unresolved = [city for city in cities if not await self.service.check_location(city)]
+        logger.info("Weather", f"预解析订阅城市 {len(cities)} 个"
+                               + (f"，无法解析：{'、'.join(unresolved)}" if unresolved else ""))
+
     async def _send_warnings(self):
         self._load_new_subscriptions()
         self._clean_expired_warnings()
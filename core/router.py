@@ -23,6 +23,9 @@ class Router:
         elif cleaned_msg.startswith("/b站"):
             bilibili_cmd = re.sub(r'^/b站\s?', '', cleaned_msg).strip()
             await handler.bilibili_handler(message.group_id, bilibili_cmd)
+        elif cleaned_msg.startswith("/用量"):
+            usage_cmd = re.sub(r'^/用量\s?', '', cleaned_msg).strip()
+            await handler.usage_handler(message.group_id, usage_cmd, message.user_id)
         elif cleaned_msg.startswith(("/帮助", "/help")):
             help_cmd = re.sub(r'^/help\s?', '', cleaned_msg).strip()
             await handler.help_handler(message.group_id, help_cmd)
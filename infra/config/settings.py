@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -12,23 +14,144 @@ class Settings(BaseSettings):
     NAPCAT_HTTP: str = "http://127.0.0.1:3000"
     NAPCAT_HTTP_AUTH_TOKEN: str = "<Token>"
 
+    # 管理员QQ号列表（JSON 格式，例如 [123456, 654321]），可使用管理命令
+    ADMIN_USER_IDS: List[int] = []
+
     # LLM 相关配置
     LLM_BASE_URL: str = "<BASE_URL>"
     LLM_API_KEY: str = "<KEY>"
     LLM_MODEL: str = "<MODEL_NAME>"
 
+    # 模型分级：小模型/大模型，留空则使用 LLM_MODEL
+    LLM_SMALL_MODEL: str = ""
+    LLM_LARGE_MODEL: str = ""
+    # 各任务使用的模型：small / large / auto（按复杂度自动选择）/ 具体模型名
+    LLM_INTENT_MODEL: str = "small"
+    LLM_CHAT_MODEL: str = "auto"
+    LLM_GREETING_MODEL: str = "large"
+    LLM_SUMMARY_MODEL: str = "small"
+    LLM_PROFILE_MODEL: str = "small"
+    # 升级到大模型的阈值：意图置信度低于该值、输入长度超过该值、工具调用数达到该值
+    LLM_ESCALATE_CONFIDENCE: float = 0.6
+    LLM_ESCALATE_QUERY_LENGTH: int = 120
+    LLM_ESCALATE_TOOL_CALLS: int = 2
+
+    # 意图识别提示词中注入的最相关工具数量（0 表示总是全部注入）；工具总数比该值多出不到 4 个时全部注入，
+    # 省去查询向量的嵌入调用
+    LLM_TOOL_TOP_K: int = 8
+
+    # 用量预算：每群每日 token 预算（0 表示不限制），达到降级比例后只使用小模型，超出预算后同时禁用工具
+    LLM_GROUP_DAILY_TOKEN_BUDGET: int = 0
+    LLM_BUDGET_DEGRADE_RATIO: float = 0.8
+
+    # 用户画像：每日整理记忆时从对话中提取用户的个人事实；回复提示词中注入的画像 token 预算（0 表示不注入）、
+    # 每位用户最多保留的事实条数
+    LLM_PROFILE_TOKEN_BUDGET: int = 200
+    LLM_PROFILE_MAX_FACTS: int = 30
+
+    # 回复预测：与意图识别并行生成直接回复，无需工具时直接使用（会额外消耗 token）
+    LLM_SPECULATIVE_REPLY: bool = False
+
+    # 工具预取：与意图识别并行发起可能的工具调用；每轮最多预取数、每小时最多浪费的预取调用数
+    SPECULATION_ENABLED: bool = True
+    SPECULATION_MAX_CALLS: int = 2
+    SPECULATION_MAX_WASTE_PER_HOUR: int = 30
+
+    # 群消息合并：每条消息后等待后续消息的静默时长（秒），从第一条消息起的最长等待（秒，0 表示不合并），单批最大消息数
+    CHAT_COALESCE_QUIET: float = 0.3
+    CHAT_COALESCE_WINDOW: float = 2.0
+    CHAT_COALESCE_MAX_BATCH: int = 5
+
     # 和风天气 API
     WEATHER_API_HOST: str = "<URL>"
     WEATHER_API_KEY: str = "<KEY>"
+    # 城市名解析缓存：查到的地点与查不到的城市名分别缓存多久（秒），订阅的城市在启动时预先解析
+    WEATHER_LOCATION_TTL: float = 30 * 86400
+    WEATHER_LOCATION_NEGATIVE_TTL: float = 86400
 
     # Embeddings API
     EMBEDDINGS_BASE_URL: str = "<BASE_URL>"
     EMBEDDINGS_API_KEY: str = "<KEY>"
     EMBEDDINGS_MODEL: str = "<MODEL_NAME>"
+    # 文档嵌入持久化缓存：目录（留空表示不缓存）、存储精度（float16/float32）、未使用多少天后淘汰、
+    # 嵌入过程中保存缓存索引的最短间隔（秒，每轮文档同步结束时总会保存）
+    EMBEDDINGS_CACHE_DIR: str = "cache/embeddings"
+    EMBEDDINGS_CACHE_DTYPE: str = "float16"
+    EMBEDDINGS_CACHE_MAX_IDLE_DAYS: int = 30
+    EMBEDDINGS_CACHE_SAVE_INTERVAL: float = 30.0
+    # 嵌入接口调用：并发批次数、每秒最多请求数、失败重试次数、查询向量合并请求的等待窗口（秒）
+    EMBEDDINGS_CONCURRENCY: int = 4
+    EMBEDDINGS_RATE_LIMIT: float = 10.0
+    EMBEDDINGS_MAX_RETRIES: int = 3
+    EMBEDDINGS_BATCH_WINDOW: float = 0.02
+
+    # RAG 文档变更扫描间隔（秒，0 表示不监视）
+    RAG_WATCH_INTERVAL: float = 30.0
+    # RAG 文档摄取：文档按文本段（字）流式读取与切块；切块进程数（0 表示 CPU 核数，1 表示不使用子进程），
+    # 待切分文档总量达到 RAG_INGEST_PARALLEL_MIN_MB 时才启用子进程；首批积攒到该切块数即写入索引，之后每批翻倍，
+    # 最多翻倍到 RAG_INGEST_COMMIT_MAX_CHUNKS，使峰值内存与语料大小无关
+    RAG_INGEST_SEGMENT_CHARS: int = 200000
+    RAG_INGEST_WORKERS: int = 0
+    RAG_INGEST_PARALLEL_MIN_MB: int = 8
+    RAG_INGEST_COMMIT_CHUNKS: int = 500
+    RAG_INGEST_COMMIT_MAX_CHUNKS: int = 4000
+    # RAG 查询缓存容量：查询向量缓存、检索结果缓存（0 表示不缓存）
+    RAG_QUERY_EMBEDDING_CACHE_SIZE: int = 1024
+    RAG_RESULT_CACHE_SIZE: int = 256
+    # RAG 向量索引类型：auto 按分区规模自动选择，也可固定为 flat / hnsw / ivf_flat / ivf_pq
+    RAG_INDEX_TYPE: str = "auto"
+    RAG_HNSW_MIN_SIZE: int = 20000
+    RAG_IVF_MIN_SIZE: int = 200000
+    RAG_IVF_PQ_MIN_SIZE: int = 1000000
+    RAG_HNSW_EF_SEARCH: int = 64
+    RAG_IVF_NPROBE: int = 16
+    # 索引文件超过该大小（MB）时以内存映射方式只读加载（0 表示不使用内存映射）
+    RAG_INDEX_MMAP_MIN_MB: int = 64
+    # RAG 向量压缩：知识库与记忆分区分别配置量化方式（none / fp16 / sq8 / pq）与 PCA 降维维度（0 表示不降维）；
+    # 分区规模达到 RAG_QUANTIZE_MIN_SIZE 后才启用压缩，量化误差可用 python -m service.rag.quantization_benchmark 评估
+    RAG_KNOWLEDGE_QUANTIZATION: str = "none"
+    RAG_KNOWLEDGE_PCA_DIM: int = 0
+    RAG_MEMORY_QUANTIZATION: str = "sq8"
+    RAG_MEMORY_PCA_DIM: int = 0
+    RAG_QUANTIZE_MIN_SIZE: int = 16
+    # RAG 混合检索：BM25 倒排索引与向量检索按倒数排名融合；
+    # 候选数为 top_k 的倍数；查询词覆盖率达到阈值的切块足以填满结果时跳过向量检索
+    RAG_HYBRID_ENABLED: bool = True
+    RAG_HYBRID_FETCH_FACTOR: int = 2
+    RAG_RRF_K: int = 60
+    RAG_LEXICAL_STRONG_COVERAGE: float = 1.0
+    # 长期记忆检索：未指定日期时检索最近几个月的分片（0 表示全部）；时间衰减半衰期（天，0 表示不衰减）及衰减下限
+    RAG_MEMORY_DEFAULT_MONTHS: int = 12
+    RAG_MEMORY_HALF_LIFE_DAYS: float = 30.0
+    RAG_MEMORY_DECAY_FLOOR: float = 0.3
 
     # 联网搜索 API
     WEB_SEARCH_URL: str = "<URL>"
     WEB_SEARCH_API_KEY: str = "<KEY>"
+    # 联网搜索结果缓存：有效期（秒，0 表示不缓存）、过期结果最长保留时间（秒）、最多缓存的查询数；
+    # 账户余额低于 WEB_SEARCH_LOW_FUND 时优先使用过期缓存（0 表示不检查余额），余额每隔 WEB_SEARCH_FUND_CHECK_INTERVAL 秒查询一次
+    WEB_SEARCH_CACHE_TTL: float = 3600
+    WEB_SEARCH_CACHE_STALE_TTL: float = 7 * 86400
+    WEB_SEARCH_CACHE_SIZE: int = 500
+    WEB_SEARCH_LOW_FUND: float = 1.0
+    WEB_SEARCH_FUND_CHECK_INTERVAL: float = 600
+    # 联网搜索结果注入提示词前的压缩：总 token 预算（0 表示不裁剪）、SimHash 指纹相差不超过该位数的结果视为转载
+    WEB_SEARCH_TOKEN_BUDGET: int = 1500
+    WEB_SEARCH_DEDUP_DISTANCE: int = 3
+
+    # HTTP 共享传输层：每个主机的最大连接数、最大保活连接数、空闲连接保活时长（秒）、是否启用 HTTP/2（需要安装 h2）；
+    # 幂等请求的最大重试次数、退避基数与最大等待（秒）；主机连续失败多少次后熔断（0 表示不熔断）、熔断时长（秒），
+    # 熔断冷却后放行的试探请求超过该时长（秒）仍无结果时重新熔断
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    HTTP_MAX_KEEPALIVE_PER_HOST: int = 5
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_RETRIES: int = 2
+    HTTP_RETRY_BACKOFF: float = 0.3
+    HTTP_RETRY_MAX_DELAY: float = 3.0
+    HTTP_BREAKER_THRESHOLD: int = 5
+    HTTP_BREAKER_COOLDOWN: float = 30.0
+    HTTP_BREAKER_PROBE_TIMEOUT: float = 15.0
 
 
 settings = Settings()
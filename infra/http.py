@@ -0,0 +1,204 @@
+"""
+共享 HTTP 传输层：各服务客户端保留自己的 httpx.AsyncClient（请求头、Cookie、base_url 互不影响），
+底层连接统一交给 SharedTransport：
+    连接池      每个主机一个连接池，限制连接数与保活时长，打开的套接字总数有上限；安装 h2 时启用 HTTP/2
+    重试        幂等请求（GET 等，或 extensions={"idempotent": True} 标记的请求）遇到连接错误、超时、
+                429/502/503/504 时按带抖动的指数退避重试
+    熔断        每个主机连续失败达到阈值后熔断一段时间，期间请求直接失败；冷却后放行一个试探请求
+    指标        按 方法 + 主机 + 路径 统计请求数、失败数与最近请求的延迟分位数
+"""
+import asyncio
+import importlib.util
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from infra.config.settings import settings
+from infra.logger import logger
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUS = {429, 502, 503, 504}
+LATENCY_SAMPLES = 256  # 每个接口保留的最近延迟样本数
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class CircuitOpenError(httpx.TransportError):
+    """主机处于熔断状态，请求未发出"""
+
+
+class _CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float, probe_timeout: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        now = time.monotonic()
+        if self._probe_started is not None and now - self._probe_started >= self.probe_timeout:
+            # 试探请求迟迟没有结果，视为失败，重新熔断
+            self._probe_started = None
+            self.opened_at = now
+        return "half_open" if now - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and self._probe_started is None:
+            self._probe_started = time.monotonic()
+            return True
+        return False
+
+    def release(self) -> None:
+        """请求被取消或因其他异常中断，没有得到结果：放弃本次试探，不改变熔断状态"""
+        self._probe_started = None
+
+    def record(self, success: bool) -> None:
+        self._probe_started = None
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.threshold > 0 and (self.opened_at is not None or self.failures >= self.threshold):
+            self.opened_at = time.monotonic()
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def snapshot(self) -> Dict[str, float]:
+        samples = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            return samples[min(len(samples) - 1, int(p * len(samples)))] if samples else 0.0
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """按主机分配连接池并附加重试、熔断与延迟统计的传输层，由所有客户端共用"""
+
+    def __init__(self):
+        self.max_retries = max(0, settings.HTTP_MAX_RETRIES)
+        self.backoff = settings.HTTP_RETRY_BACKOFF
+        self.http2 = settings.HTTP2_ENABLED and HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pools: Dict[Tuple[bytes, bytes, Optional[int]], httpx.AsyncHTTPTransport] = {}
+        self._breakers: Dict[str, _CircuitBreaker] = {}
+        self._stats: Dict[str, _EndpointStats] = {}
+
+    def _pool(self, url: httpx.URL) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 连接绑定在事件循环上，换了事件循环（如测试脚本）时重新建立连接池
+            self._loop = loop
+            self._pools = {}
+        key = (url.raw_scheme, url.raw_host, url.port)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = httpx.AsyncHTTPTransport(http2=self.http2 and url.scheme == "https", limits=self.limits)
+            self._pools[key] = pool
+        return pool
+
+    def _breaker(self, host: str) -> _CircuitBreaker:
+        if host not in self._breakers:
+            self._breakers[host] = _CircuitBreaker(settings.HTTP_BREAKER_THRESHOLD, settings.HTTP_BREAKER_COOLDOWN,
+                                                  settings.HTTP_BREAKER_PROBE_TIMEOUT)
+        return self._breakers[host]
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.HTTP_RETRY_MAX_DELAY)
+        # 完全抖动：在 [0, backoff * 2^attempt] 内随机等待，避免多个请求同时重试
+        return random.uniform(0, min(settings.HTTP_RETRY_MAX_DELAY, self.backoff * 2 ** attempt))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        endpoint = f"{request.method} {host}{request.url.path}"
+        stats = self._stats.setdefault(endpoint, _EndpointStats())
+        breaker = self._breaker(host)
+        idempotent = request.method in IDEMPOTENT_METHODS or bool(request.extensions.get("idempotent"))
+        retries = self.max_retries if idempotent else 0
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                stats.errors += 1
+                raise CircuitOpenError(f"{host} 熔断中，请求未发出", request=request)
+            stats.requests += 1
+            start = time.perf_counter()
+            try:
+                response = await self._pool(request.url).handle_async_request(request)
+            except httpx.TransportError as e:
+                stats.latencies.append((time.perf_counter() - start) * 1000)
+                stats.errors += 1
+                breaker.record(False)
+                if attempt >= retries:
+                    raise
+                delay = self._delay(attempt, None)
+                logger.debug("HTTP", f"{endpoint} {type(e).__name__}，{delay:.2f}s 后重试")
+            except BaseException:
+                # 取消（如预取的工具调用被放弃）或其他异常：释放试探名额，避免主机一直停留在熔断状态
+                breaker.release()
+                raise
+            else:
+                stats.latencies.append((time.perf_counter() - start) * 1000)
+                failed = response.status_code >= 500 or response.status_code == 429
+                breaker.record(not failed)
+                if failed:
+                    stats.errors += 1
+                if response.status_code not in RETRY_STATUS or attempt >= retries:
+                    return response
+                delay = self._delay(attempt, response)
+                await response.aclose()
+                logger.debug("HTTP", f"{endpoint} HTTP {response.status_code}，{delay:.2f}s 后重试")
+            attempt += 1
+            stats.retries += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        # 共享传输层随进程存在，单个客户端关闭时不关闭连接池
+        pass
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各接口的请求数、失败数、重试数与延迟分位数（毫秒）"""
+        return {endpoint: stats.snapshot() for endpoint, stats in self._stats.items()}
+
+    def open_circuits(self) -> List[str]:
+        return [host for host, breaker in self._breakers.items() if breaker.state != "closed"]
+
+
+shared_transport = SharedTransport()
+
+
+def create_client(timeout: httpx.Timeout = httpx.Timeout(10, connect=5), **kwargs: Any) -> httpx.AsyncClient:
+    """创建使用共享传输层的客户端，参数同 httpx.AsyncClient"""
+    return httpx.AsyncClient(transport=shared_transport, timeout=timeout, **kwargs)
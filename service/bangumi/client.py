@@ -1,6 +1,7 @@
 import httpx
 from typing import Optional, List
 
+from infra.http import create_client
 from infra.logger import logger
 from .models import CalendarDay, Weekday, Subject, SubjectImage, SubjectRating
 
@@ -13,10 +14,7 @@ class BangumiClient:
             "Accept": "application/json"
         }
         # Bangumi 官方的要求，不添加 User-Agent 可能会被拒绝，请参考 https://github.com/bangumi/api/blob/master/docs-raw/user%20agent.md
-        self.client = httpx.AsyncClient(
-            headers=self.headers,
-            timeout=httpx.Timeout(10, connect=5),
-        )
+        self.client = create_client(headers=self.headers)
 
     async def get_calendar(self) -> Optional[List[CalendarDay]]:
         """获取每日放送信息"""
@@ -3,6 +3,7 @@ import asyncio
 from typing import Optional, Tuple
 from urllib.parse import urlparse, parse_qs
 
+from infra.http import create_client
 from infra.logger import logger
 from .models import (
     QRCodeGenerateResponse, QRCodePollResponse, BiliCookie,
@@ -27,11 +28,7 @@ class BiliClient:
             "Connection": "keep-alive",
             "Referer": "https://passport.bilibili.com/login",
         }  # 随便造一个
-        self.client = httpx.AsyncClient(
-            headers=self.headers,
-            timeout=httpx.Timeout(10, connect=5),
-            follow_redirects=True
-        )
+        self.client = create_client(headers=self.headers, follow_redirects=True)
 
     # -----------------这是一条登录/鉴权部分的分割线----------------- #
     async def generate_qrcode(self) -> Optional[Tuple[str, str]]:
@@ -42,7 +39,7 @@ class BiliClient:
 
         try:
             response = await self.client.get(url)
-        except httpx.Timeout:
+        except httpx.TimeoutException:
             logger.warn("BiliClient", "生成二维码超时")
             return None
         except Exception as e:
@@ -79,7 +76,7 @@ class BiliClient:
 
         try:
             response = await self.client.get(url, params=params)
-        except httpx.Timeout:
+        except httpx.TimeoutException:
             logger.warn("BiliClient", "轮询二维码超时")
             return None
         except Exception as e:
@@ -217,7 +214,7 @@ class BiliClient:
 
         try:
             response = await self.client.get(url, params=params, cookies=cookie_dict)
-        except httpx.Timeout:
+        except httpx.TimeoutException:
             logger.warn("BiliClient", f"获取UP主 {host_mid} 动态超时")
             return None
         except Exception as e:
@@ -1,8 +1,7 @@
 import asyncio
 import json
-from datetime import timedelta
-from pathlib import Path
-from typing import Dict, Any, List
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from langchain_core.chat_history import InMemoryChatMessageHistory
@@ -10,28 +9,31 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_openai import ChatOpenAI
 
 from infra.config.settings import settings
 from infra.logger import logger
 from service.llm.models import ChatMessage, ChatRequest, ChatResponse, IntentRecognitionResult
+from service.llm.profile import profile_store
 from service.llm.prompts import prompts
-from service.llm.tools import ToolManager
+from service.llm.speculation import ToolSpeculator, ReplySpeculationStats
+from service.llm.tiering import ModelRouter, TIER_LARGE, TIER_SMALL
+from service.llm.tool_selector import ToolSelector
+from service.llm.tools import ToolManager, current_group_id
+from service.llm.usage import usage_store
+from service.rag.memory_store import memory_store
 
 
 class LLMService:
     def __init__(self):
-        self.llm: Runnable = ChatOpenAI(
-            api_key=settings.LLM_API_KEY,
-            base_url=settings.LLM_BASE_URL,
-            model=settings.LLM_MODEL,
-            max_tokens=512,
-            temperature=0.7,
-            timeout=30.0,
-            streaming=False,
-        )
+        self.router = ModelRouter()
+        self.llm: Runnable = self.router.get_llm(TIER_LARGE)
         self.tool_manager = ToolManager()
-        self.intent_chain: Runnable = self._build_intent_chain()
+        self.speculator = ToolSpeculator(self.tool_manager)
+        self.reply_speculation = ReplySpeculationStats()
+        self.tool_selector = ToolSelector(self.tool_manager.tools, settings.LLM_TOOL_TOP_K)
+        self.intent_prompt: PromptTemplate = self._build_intent_prompt()
+        self.intent_parser = JsonOutputParser(pydantic_object=IntentRecognitionResult)
+        self.profile_parser = JsonOutputParser()
         self.session_store: Dict[str, CustomConversationSummaryMemory] = {}
         self.daily_memory_store: Dict[str, List[str]] = {}
         self.short_memory_store: Dict[str, List[str]] = {}
@@ -57,12 +59,14 @@ class LLMService:
             ],
         )
         lc_msgs = self._to_lc_messages(req.messages)
-        response = await self.llm.ainvoke(lc_msgs)
-        return ChatResponse(reply=response.content)
+        response, usage = await self.router.ainvoke("chat", self.router.chat_tier(msg), lc_msgs)
+        return ChatResponse(reply=response.content, usage=usage)
 
     async def chat_with_memory(self, msg: str, session_id: str, user_id: str) -> ChatResponse:
         if session_id not in self.session_store:
-            self.session_store[session_id] = CustomConversationSummaryMemory(self.llm)
+            self.session_store[session_id] = CustomConversationSummaryMemory(
+                self.router.get_llm(self.router.task_tier("summary"))
+            )
 
         memory = self.session_store[session_id]
         summary = memory.load_summary()
@@ -82,19 +86,18 @@ class LLMService:
             template=prompt_template
         )
 
-        chain = prompt | self.llm
-        response = await chain.ainvoke({
-            "system_prompt": prompts.DEFAULT_SYSTEM_PROMPT,
-            "chat_history": summary,
-            "input": f"{user_id}: {msg}"
-        })
+        response, usage = await self.router.ainvoke("chat", self.router.chat_tier(msg), prompt.format(
+            system_prompt=prompts.DEFAULT_SYSTEM_PROMPT,
+            chat_history=summary,
+            input=f"{user_id}: {msg}",
+        ), group_id=session_id)
 
         memory.save_context(f"{user_id}: {msg}", response.content)
         memory.update_summary()  # 更新摘要
 
-        return ChatResponse(reply=response.content)
+        return ChatResponse(reply=response.content, usage=usage)
 
-    async def generate_greeting(self, msg: str) -> ChatResponse:
+    async def generate_greeting(self, msg: str, group_id: Optional[str] = None) -> ChatResponse:
         prompt = PromptTemplate.from_template(prompts.GREETING_PROMPT).format(content=msg)
         req = ChatRequest(
             messages=[
@@ -102,13 +105,23 @@ class LLMService:
             ],
         )
         lc_msgs = self._to_lc_messages(req.messages)
-        response = await self.llm.ainvoke(lc_msgs)
-        return ChatResponse(reply=response.content)
+        response, usage = await self.router.ainvoke("greeting", self.router.task_tier("greeting"), lc_msgs,
+                                                    group_id=group_id)
+        return ChatResponse(reply=response.content, usage=usage)
 
     async def agent_chat(self, msg: str, group_id: str, user_id) -> ChatResponse:
+        return await self._agent_turn(group_id, [(user_id, msg)])
+
+    async def agent_chat_batch(self, group_id: str, messages: List[Tuple[Any, str]]) -> ChatResponse:
+        """将同一群在短时间内收到的多条消息合并为一轮对话，一次回复所有发言者"""
+        return await self._agent_turn(group_id, messages)
+
+    async def _agent_turn(self, group_id: str, messages: List[Tuple[Any, str]]) -> ChatResponse:
         prompt_template = """
                 {system_prompt}
                 
+                {user_profile}
+                
                 {history_message}
                 
                 {input}
@@ -117,19 +130,76 @@ class LLMService:
         """
         prompt = PromptTemplate(
             template=prompt_template,
-            input_variables=["system_prompt", "history_message", "input", "tool_calling"],
+            input_variables=["system_prompt", "user_profile", "history_message", "input", "tool_calling"],
         )
-        chain = prompt | self.llm
 
-        ir_output = await self.intent_chain.ainvoke({"user_query": msg})
-        ir_result = IntentRecognitionResult(**ir_output)
-        logger.info("LLM Tool Calling", f"意图识别结果: {ir_output}")
+        current_group_id.set(str(group_id))
+        input_text = "\n".join(f"{user_id}: {msg}" for user_id, msg in messages)
+        query = messages[0][1] if len(messages) == 1 else input_text
+        if len(messages) > 1:
+            input_text += "\n\n" + prompts.BATCH_REPLY_PROMPT
+
+        history_message = self.short_memory_store.get(group_id, [])
+        history_message_str = "\n".join(history_message)
+        # 注入本轮发言者的画像，多数“还记得我吗”类问题无需检索长期记忆
+        user_profile = profile_store.render(group_id, [user_id for user_id, _ in messages], query,
+                                            settings.LLM_PROFILE_TOKEN_BUDGET)
+
+        def build_reply_prompt(tool_calling_text: str) -> str:
+            return prompt.format(
+                system_prompt=prompts.DEFAULT_SYSTEM_PROMPT,
+                user_profile=user_profile,
+                history_message=history_message_str,
+                input=input_text,
+                tool_calling=tool_calling_text,
+            )
+
+        # 按群每日预算降级：超过降级比例只用小模型，超出预算时同时禁用工具
+        budget_level = usage_store.budget_level(group_id)
+        if budget_level != "normal":
+            logger.info("LLM Usage", f"群 {group_id} 今日用量已达预算等级 {budget_level}，降级处理")
+        turn_usage: Dict[str, int] = {}
+
+        speculative_reply: Optional[asyncio.Task] = None
+        if budget_level == "exhausted":
+            ir_result, escalated = IntentRecognitionResult(should_call_tool=False, confidence=0.0), False
+            speculation = None
+        else:
+            # 根据本地规则预取可能需要的工具，与意图识别并行
+            speculation = self.speculator.start(query)
+            if settings.LLM_SPECULATIVE_REPLY:
+                # 与意图识别并行生成不带工具结果的回复，无需工具时直接使用
+                spec_tier = self.router.chat_tier(query) if budget_level == "normal" else TIER_SMALL
+                speculative_reply = asyncio.create_task(self.router.ainvoke(
+                    "chat_speculative", spec_tier, build_reply_prompt(""), group_id=group_id
+                ))
+            ir_result, escalated = await self._recognize_intent(
+                query, group_id, turn_usage, allow_escalation=budget_level == "normal",
+                always_include=speculation.tool_names(),
+            )
+            logger.info("LLM Tool Calling", f"意图识别结果: {ir_result.model_dump()}")
+
+        need_tools = ir_result.should_call_tool and bool(ir_result.tool_calls)
+        if speculative_reply:
+            speculative_result = await self.reply_speculation.resolve(speculative_reply, use=not need_tools)
+            if speculative_result:
+                response, usage = speculative_result
+                self.router.merge_usage(turn_usage, usage)
+                if speculation:
+                    speculation.discard()
+                self.update_history_messages(group_id, messages, response.content)
+                return ChatResponse(reply=response.content, usage=turn_usage)
 
         tool_calling_text = ""
-        if ir_result.should_call_tool and ir_result.tool_calls:
-            tool_calling_results = await self.tool_manager.call_tools(ir_result)
+        if need_tools:
+            try:
+                tool_calling_results = await self.tool_manager.call_tools(ir_result, speculation)
+            finally:
+                if speculation:
+                    speculation.discard()
             tool_results = []
             for result in tool_calling_results:
+                usage_store.record(group_id, f"tool:{result.tool_name}", seconds=result.elapsed)
                 if result.success:
                     tool_results.append(
                         self._format_tool_success_response(result.tool_name, result.result)
@@ -140,20 +210,58 @@ class LLMService:
                     )
             tool_calling_text = "\n\n".join(tool_results)
             logger.info("LLM Tool Calling", tool_calling_text)
+        elif speculation:
+            speculation.discard()
 
-        history_message = self.short_memory_store.get(group_id, [])
-        history_message_str = "\n".join(history_message)
+        if budget_level == "normal":
+            reply_tier = self.router.chat_tier(query, len(ir_result.tool_calls), escalated)
+        else:
+            reply_tier = TIER_SMALL
+        response, usage = await self.router.ainvoke("chat", reply_tier, build_reply_prompt(tool_calling_text),
+                                                    group_id=group_id)
+        self.router.merge_usage(turn_usage, usage)
 
-        response = await chain.ainvoke({
-            "system_prompt": prompts.DEFAULT_SYSTEM_PROMPT,
-            "history_message": history_message_str,
-            "input": f"{user_id}: {msg}",
-            "tool_calling": tool_calling_text,
-        })
+        self.update_history_messages(group_id, messages, response.content)
 
-        self.update_history_message(group_id, user_id, msg, response.content)
+        return ChatResponse(reply=response.content, usage=turn_usage)
 
-        return ChatResponse(reply=response.content)
+    async def _recognize_intent(self, msg: str, group_id: Optional[str], turn_usage: Dict[str, int],
+                                allow_escalation: bool = True,
+                                always_include: Iterable[str] = ()) -> Tuple[IntentRecognitionResult, bool]:
+        """
+        意图识别：先使用小模型，置信度不足或输出无法解析时升级到大模型
+        提示词中只注入与查询最相关的工具（always_include 中的工具总会注入）
+        返回识别结果以及是否发生了升级，用量累加到 turn_usage
+        """
+        tool_names = await self.tool_selector.select(msg, always_include)
+        intent_prompt = self.intent_prompt.format(tools=self.tool_selector.render(tool_names), user_query=msg,
+                                                  today=datetime.now().strftime("%Y-%m-%d"))
+        tier = self.router.intent_tier(msg) if allow_escalation else TIER_SMALL
+        result = await self._invoke_intent(tier, intent_prompt, group_id, turn_usage)
+
+        confidence = result.confidence if result else None
+        if allow_escalation and self.router.should_escalate_intent(tier, confidence):
+            logger.info("LLM Tier", f"意图识别置信度不足({confidence})，升级到大模型")
+            escalated_result = await self._invoke_intent(TIER_LARGE, intent_prompt, group_id, turn_usage)
+            if escalated_result:
+                return escalated_result, True
+
+        if result is None:
+            logger.warn("LLM Tool Calling", "意图识别失败，按无需调用工具处理")
+            return IntentRecognitionResult(should_call_tool=False, confidence=0.0), tier == TIER_LARGE
+        return result, tier == TIER_LARGE
+
+    async def _invoke_intent(self, tier: str, intent_prompt: str, group_id: Optional[str],
+                             turn_usage: Dict[str, int]) -> Optional[IntentRecognitionResult]:
+        try:
+            # 使用更低的temperature保证更低的随机性
+            response, usage = await self.router.ainvoke("intent", tier, intent_prompt, temperature=0.1,
+                                                        group_id=group_id)
+            self.router.merge_usage(turn_usage, usage)
+            return IntentRecognitionResult(**self.intent_parser.parse(response.content))
+        except Exception as e:
+            logger.warn("LLM Tool Calling", f"[{tier}] 意图识别结果解析失败: {e}")
+            return None
 
     # 格式化工具调用成功的响应
     @staticmethod
@@ -165,37 +273,23 @@ class LLMService:
     def _format_tool_error_response(tool_name: str, error: str) -> str:
         return f"工具「{tool_name}」调用失败：\n{error}"
 
-    def _build_intent_chain(self) -> Runnable:
-        tools_definition = json.dumps([tool.get_definition() for tool in self.tool_manager.tools.values()],
-                                      ensure_ascii=False, indent=2)
-
-        prompt = PromptTemplate(
+    @staticmethod
+    def _build_intent_prompt() -> PromptTemplate:
+        # 工具列表按查询挑选后再填入
+        return PromptTemplate(
             template=prompts.FUNCTION_CALLING_INTENT_PROMPT,
-            input_variables=["tools", "user_query"],
-            partial_variables={"tools": tools_definition},
+            input_variables=["tools", "user_query", "today"],
         )
 
-        judge_llm = ChatOpenAI(
-            api_key=settings.LLM_API_KEY,
-            base_url=settings.LLM_BASE_URL,
-            model=settings.LLM_MODEL,
-            max_tokens=512,
-            temperature=0.1,  # 使用更低的temperature保证更低的随机性
-            timeout=30.0,
-            streaming=False,
-        )
-
-        parser = JsonOutputParser(pydantic_object=IntentRecognitionResult)
-
-        chain = prompt | judge_llm | parser
+    def update_history_message(self, group_id: str, user_id: str, msg: str, response: str) -> None:
+        self.update_history_messages(group_id, [(user_id, msg)], response)
 
-        return chain
+    def update_history_messages(self, group_id: str, messages: List[Tuple[Any, str]], response: str) -> None:
+        lines = [f"{user_id}: {msg}" for user_id, msg in messages]
+        lines.append(f"AI: {response}")
 
-    def update_history_message(self, group_id: str, user_id: str, msg: str, response: str) -> None:
         history_message = self.short_memory_store.get(group_id, [])
-
-        history_message.append(f"{user_id}: {msg}")
-        history_message.append(f"AI: {response}")
+        history_message.extend(lines)
 
         # 按短记忆长度截断
         history_message = history_message[-self.short_memory_length * 2:]
@@ -203,9 +297,7 @@ class LLMService:
         self.short_memory_store[group_id] = history_message
 
         daily_history_message = self.daily_memory_store.get(group_id, [])
-
-        daily_history_message.append(f"{user_id}: {msg}")
-        daily_history_message.append(f"AI: {response}")
+        daily_history_message.extend(lines)
 
         self.daily_memory_store[group_id] = daily_history_message
 
@@ -218,38 +310,61 @@ class LLMService:
             template="总结以下的对话内容形成对话摘要，摘要需要尽可能保留对话的关键信息，请注意要明确根据数字（用户id）来区分不同用户所说的内容:\n{messages}"
         )
         summary_request = summary_prompt.format(messages=daily_history_message_str)
-        summary_response = self.llm.invoke([SystemMessage(summary_request)])
+        summary_response, _ = self.router.invoke("summary", self.router.task_tier("summary"),
+                                                 [SystemMessage(summary_request)], group_id=group_id)
 
         # 导出摘要后清空日对话记录
         self.daily_memory_store[group_id] = []
 
         return summary_response.content
 
+    def extract_user_profiles(self, group_id: str, date: str) -> int:
+        """从群当日的对话记录中提取用户的个人事实并合并到用户画像，返回变更的条目数"""
+        lines = self.daily_memory_store.get(group_id, [])
+        user_ids = {line.split(":", 1)[0].strip() for line in lines if ":" in line and not line.startswith("AI:")}
+        if not user_ids:
+            return 0
+        known = {user_id: facts for user_id in sorted(user_ids) if (facts := profile_store.get(group_id, user_id))}
+        request = prompts.PROFILE_EXTRACTION_PROMPT.format(
+            known=json.dumps(known, ensure_ascii=False) if known else "无",
+            messages="\n".join(lines),
+        )
+        response, _ = self.router.invoke("profile", self.router.task_tier("profile"), [SystemMessage(request)],
+                                         temperature=0.1, group_id=group_id)
+        extracted = self.profile_parser.parse(response.content)
+        if not isinstance(extracted, dict):
+            return 0
+
+        changed = 0
+        for user_id, facts in extracted.items():
+            # 只接受当日发言者的事实，避免模型臆造其他用户
+            if str(user_id) in user_ids and isinstance(facts, dict):
+                changed += profile_store.update(group_id, str(user_id), facts, date)
+        return changed
+
     def save_daily_memory(self):
         try:
-            # 获取当前日期
-            from datetime import datetime
             date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
 
-            file_path = Path.cwd() / "rag_docs" / "daily_memory.txt"
-            file_path.parent.mkdir(exist_ok=True)  # 确保 rag_docs 存在
-            file_path.touch(exist_ok=True)  # 确保文件存在
-
-            # 汇总所有群的摘要
-            summaries = []
+            # 每个群的摘要写入 群/月 分片，由 RAG 服务的文档监视增量索引；
+            # 摘要前先提取用户画像（摘要会清空当日对话记录）
+            saved = 0
+            profile_changes = 0
             for group_id in list(self.daily_memory_store.keys()):
                 if self.daily_memory_store[group_id]:  # 确保有记录
+                    try:
+                        profile_changes += self.extract_user_profiles(group_id, date)
+                    except Exception as e:
+                        logger.warn("LLM", f"群 {group_id} 用户画像提取失败: {e}")
                     summary = self.summarize_daily_memory(group_id)
-                    summaries.append(f"【群 {group_id}】\n{summary}\n")
-
-            # 写入
-            if summaries:
-                with open(file_path, "a", encoding="utf-8") as f:
-                    f.write(f"日期：{date}\n")
-                    f.write("=" * 30 + "\n")
-                    f.write("\n".join(summaries))
-                    f.write("=" * 30 + "\n")
-                    logger.info("LLM", f"Daily memory appended. {summaries}")
+                    memory_store.append(group_id, date, summary)
+                    saved += 1
+
+            if profile_changes:
+                profile_store.save_profiles()
+                logger.info("LLM", f"User profiles updated: {profile_changes} fact(s).")
+            if saved:
+                logger.info("LLM", f"Daily memory saved for {saved} group(s).")
             else:
                 logger.info("LLM", "No daily memory to save.")
 
@@ -268,6 +383,7 @@ class LLMService:
 
     def scheduler_stop(self):
         self.daily_memory_scheduler.shutdown()
+        usage_store.flush()
 
 
 class CustomConversationSummaryMemory:
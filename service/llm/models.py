@@ -49,6 +49,7 @@ class ToolCallResult(BaseModel):
     success: bool
     result: Any
     error: Optional[str] = None
+    elapsed: float = 0.0  # 调用耗时（秒）
 
 
 class ToolCallPlan(BaseModel):
@@ -0,0 +1,118 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from infra.config.settings import settings
+from infra.logger import logger
+from service.rag.lexical import tokenize
+
+_CJK_RE = re.compile(r"[一-龥]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约一字一个 token，其余字符约四个一个 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ProfileStore:
+    """
+    用户画像存储：按 群 -> 用户 -> 属性 保存从对话中提取的个人事实（生日、所在城市等），
+    每项记录值与更新日期，持久化到本地
+    """
+
+    def __init__(self, json_file: str = "cache/user_profiles.json", max_facts: int = 30):
+        self.json_file = json_file
+        self.max_facts = max_facts
+        self._lock = threading.Lock()  # 提取任务在调度线程中执行
+        self.profiles: Dict[str, Dict[str, Dict[str, Dict[str, str]]]] = self.load_profiles(json_file)
+
+    @staticmethod
+    def load_profiles(json_file: str) -> Dict[str, Dict[str, Dict[str, Dict[str, str]]]]:
+        if not os.path.exists(json_file):
+            return {}
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warn("Profile", f"用户画像读取失败: {e}")
+            return {}
+
+    def save_profiles(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.json_file), exist_ok=True)
+            tmp_file = f"{self.json_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(self.profiles, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.json_file)
+        except Exception as e:
+            logger.warn("Profile", f"保存用户画像失败: {e}")
+
+    def get(self, group_id: str, user_id: str) -> Dict[str, str]:
+        with self._lock:
+            facts = self.profiles.get(str(group_id), {}).get(str(user_id), {})
+            return {key: fact["value"] for key, fact in facts.items()}
+
+    def update(self, group_id: str, user_id: str, facts: Dict[str, Optional[str]], date: str) -> int:
+        """
+        合并新提取的事实：值为空表示该事实已不成立，删除对应属性；
+        超过条目上限时丢弃最久未更新的属性。返回变更的条目数
+        """
+        changed = 0
+        with self._lock:
+            profile = self.profiles.setdefault(str(group_id), {}).setdefault(str(user_id), {})
+            for key, value in facts.items():
+                key = str(key).strip()
+                value = str(value).strip() if value is not None else ""
+                if not key:
+                    continue
+                if not value:
+                    changed += profile.pop(key, None) is not None
+                elif profile.get(key, {}).get("value") != value:
+                    profile[key] = {"value": value, "updated": date}
+                    changed += 1
+            if len(profile) > self.max_facts:
+                for key in sorted(profile, key=lambda k: profile[k]["updated"])[:len(profile) - self.max_facts]:
+                    del profile[key]
+            if not profile:
+                self.profiles[str(group_id)].pop(str(user_id), None)
+        return changed
+
+    def render(self, group_id: str, user_ids: Iterable[str], query: str, budget: int) -> str:
+        """
+        生成注入提示词的画像文本：只包含本轮发言者的事实，
+        与查询字面重叠多的、更新较近的条目优先，总量不超过 budget 个 token
+        """
+        if budget <= 0:
+            return ""
+        query_terms = set(tokenize(query))
+        candidates: List[Tuple[int, str, str, str, str]] = []
+        with self._lock:
+            group = self.profiles.get(str(group_id), {})
+            for user_id in dict.fromkeys(str(u) for u in user_ids):
+                for key, fact in group.get(user_id, {}).items():
+                    overlap = len(query_terms & set(tokenize(f"{key}{fact['value']}")))
+                    candidates.append((overlap, fact["updated"], user_id, key, fact["value"]))
+        if not candidates:
+            return ""
+
+        candidates.sort(key=lambda c: (c[0], c[1]), reverse=True)
+        header = "已知的对话者资料（来自以往的对话，可能已过时，仅在相关时参考）："
+        used = estimate_tokens(header)
+        selected: Dict[str, List[str]] = {}
+        for _, _, user_id, key, value in candidates:
+            item = f"{key} {value}"
+            cost = estimate_tokens(item) + (estimate_tokens(user_id) + 4 if user_id not in selected else 1)
+            if used + cost > budget:
+                continue
+            used += cost
+            selected.setdefault(user_id, []).append(item)
+        if not selected:
+            return ""
+        lines = [header] + [f"- 用户 {user_id}：{'；'.join(items)}" for user_id, items in selected.items()]
+        return "\n".join(lines)
+
+
+profile_store = ProfileStore(max_facts=settings.LLM_PROFILE_MAX_FACTS)
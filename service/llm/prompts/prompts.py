@@ -56,12 +56,33 @@ GREETING_PROMPT = DEFAULT_SYSTEM_PROMPT + '\n' + '''
         {content}
 '''
 
+BATCH_REPLY_PROMPT = """
+    以上是多位群成员几乎同时发给你的消息（每行开头的数字是发言者的用户id）。
+    请在一条回复中依次回应每一位发言者，回应某人时以“@用户id”开头称呼对方，例如“@123456 ……”，
+    不要遗漏任何人，也不要把不同人说的话混在一起。
+"""
+
+PROFILE_EXTRACTION_PROMPT = """
+    - 任务：
+        从下面的群聊记录中提取每位用户（以行首的数字用户id区分，AI 的发言不算）主动透露的、长期稳定的个人事实，
+        例如生日、所在城市、职业、学校、爱好、宠物、希望的称呼等。
+        不要提取一时的情绪、临时安排、对他人的评价或 AI 推测的内容。
+    - 已知资料（用于更新；用户明确表示某项已不成立时，将该项的值设为空字符串）：
+        {known}
+    - 群聊记录：
+        {messages}
+    - 输出格式：
+        只输出 JSON 对象，键为用户id，值为 属性 -> 值 的对象，属性名使用简短的中文（如"生日"、"所在城市"），
+        没有可提取的事实时输出 {{}}。例如：
+        {{"123456": {{"生日": "3月5日", "所在城市": "上海"}}}}
+"""
+
 FUNCTION_CALLING_INTENT_PROMPT = """
     - 任务：
         你是一个智能助手，需要判断用户的查询是否需要调用工具，以及调用哪些工具。
         如果需要调用工具，请选择所有合适的工具并分别确定所需参数，支持多次调用同一工具。
         请根据提供的工具列表进行判断。
-    - 可用工具详细信息列表：
+    - 可用工具列表（每行一个工具，格式为 工具名(参数名:类型 说明, ...)：工具描述，参数类型后带*表示必填，[a-b]表示取值范围）：
         {tools}
     - 返回格式：
         请严格按照以下JSON格式返回结果:
@@ -85,5 +106,6 @@ FUNCTION_CALLING_INTENT_PROMPT = """
         5. 支持多次调用同一个工具（参数可以不同）
         6. confidence字段表示你对这个判断的信心程度，1.0表示最确定
         
+    当前日期：{today}
     用户请求：{user_query}
 """
@@ -0,0 +1,170 @@
+"""
+联网搜索结果压缩：去除转载造成的近似重复结果，按与查询的相关度排序，
+再抽取相关度最高的句子，使整体不超过 token 预算，每条结果保留标题、站点与链接
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from service.rag.lexical import tokenize
+from service.search.models import WebPageValue
+from .profile import estimate_tokens
+
+_SENTENCE_RE = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*\s*")
+# 一条结果的片段被另一条包含的比例达到该值时视为转载
+_CONTAINMENT_THRESHOLD = 0.8
+# 搜索引擎原始排名在相关度中的权重
+_RANK_WEIGHT = 0.3
+# 最相关的一句放不下时截断到剩余预算，剩余预算少于该值则不再放入新的结果
+_MIN_SENTENCE_TOKENS = 16
+
+
+@dataclass
+class _Result:
+    rank: int
+    page: WebPageValue
+    text: str
+    shingles: Set[str]
+    fingerprint: int
+    relevance: float = 0.0
+    also: List[str] = field(default_factory=list)  # 被合并的转载来源
+    sentences: List[str] = field(default_factory=list)
+    scores: List[float] = field(default_factory=list)
+    selected: Set[int] = field(default_factory=set)
+
+
+def simhash(tokens: List[str]) -> int:
+    """64 位 SimHash：按词频加权，近似文本的指纹只相差少数几位"""
+    weights = [0] * 64
+    for token, count in Counter(tokens).items():
+        value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _is_duplicate(a: _Result, b: _Result, max_distance: int) -> bool:
+    if bin(a.fingerprint ^ b.fingerprint).count("1") <= max_distance:
+        return True
+    smaller = min(len(a.shingles), len(b.shingles))
+    return smaller > 0 and len(a.shingles & b.shingles) / smaller >= _CONTAINMENT_THRESHOLD
+
+
+def _coverage(terms: Set[str], query_weights: Dict[str, float]) -> float:
+    total = sum(query_weights.values())
+    return sum(w for t, w in query_weights.items() if t in terms) / total if total else 0.0
+
+
+def _truncate(text: str, tokens: int) -> str:
+    while text and estimate_tokens(text) > tokens:
+        text = text[:max(0, len(text) * tokens // estimate_tokens(text) - 1)]
+    return text
+
+
+def _header(index: int, item: _Result) -> str:
+    page = item.page
+    source = "，".join(part for part in (page.siteName, page.datePublished[:10]) if part)
+    if item.also:
+        source += f"，另见 {'、'.join(item.also)}"
+    return f"【结果 {index}】{page.name}（{source}）"
+
+
+def _omitted(count: int) -> str:
+    return f"（另有 {count} 条结果因篇幅省略）"
+
+
+def _render_text(item: _Result) -> str:
+    parts, previous = [], None
+    for i in sorted(item.selected):
+        if previous is not None and i != previous + 1:
+            parts.append("…")
+        parts.append(item.sentences[i])
+        previous = i
+    text = "".join(parts).strip()
+    truncated = item.selected and max(item.selected) < len(item.sentences) - 1
+    return text + "…" if truncated and not text.endswith("…") else text
+
+
+def compact_results(query: str, pages: List[WebPageValue], budget: int, max_distance: int = 3) -> str:
+    """
+    将搜索结果压缩为不超过 budget 个 token 的文本（budget 为 0 时不裁剪），开头附带说明查询的标题：
+    近似重复的结果合并到相关度更高的一条并记录其来源；每条结果先放入最相关的一句，
+    剩余预算再按句子相关度分配，句子保持原文顺序；放不下的结果整条省略。
+    标题与省略说明先从预算中扣除，预算小于这部分固定开销时只输出标题与省略说明
+    """
+    results: List[_Result] = []
+    for rank, page in enumerate(pages):
+        text = (page.summary or page.snippet or "").strip()
+        if not text:
+            continue
+        tokens = tokenize(text)
+        results.append(_Result(rank, page, text, set(tokens), simhash(tokens)))
+    if not results:
+        return ""
+
+    # 查询词按结果集内的逆文档频率加权，各结果都出现的泛化词权重低
+    doc_freq = Counter(term for item in results for term in item.shingles | set(tokenize(item.page.name)))
+    query_weights = {term: math.log(1 + len(results) / (1 + doc_freq[term])) + 0.1 for term in set(tokenize(query))}
+    for item in results:
+        terms = item.shingles | set(tokenize(item.page.name))
+        item.relevance = _coverage(terms, query_weights) + _RANK_WEIGHT * (1 - item.rank / len(results))
+    results.sort(key=lambda r: (-r.relevance, r.rank))
+
+    kept: List[_Result] = []
+    for item in results:
+        original = next((k for k in kept if _is_duplicate(k, item, max_distance)), None)
+        if original is None:
+            kept.append(item)
+        elif item.page.siteName and item.page.siteName != original.page.siteName \
+                and item.page.siteName not in original.also:
+            original.also.append(item.page.siteName)
+
+    for item in kept:
+        # 同一结果内重复出现的句子只保留一次
+        item.sentences = list(dict.fromkeys(s for s in _SENTENCE_RE.findall(item.text) if s.strip())) or [item.text]
+        item.scores = [_coverage(set(tokenize(s)), query_weights) for s in item.sentences]
+
+    title = f"与 '{query}' 相关的搜索结果："
+    if budget <= 0:
+        for item in kept:
+            item.selected = set(range(len(item.sentences)))
+        return "\n\n".join([title] + [f"{_header(i, item)}\n{_render_text(item)}\n来源：{item.page.url}"
+                                      for i, item in enumerate(kept, 1)])
+
+    # 标题与最长的省略说明是固定开销，先预留
+    reserved = estimate_tokens(title) + estimate_tokens(_omitted(len(kept))) + 2
+    # 第一轮：按相关度依次放入每条结果的标题、来源与最相关的一句，句子过长时截断
+    used, included = reserved, []
+    for item in kept:
+        best = max(range(len(item.sentences)), key=lambda i: (item.scores[i], -i))
+        overhead = estimate_tokens(_header(len(included) + 1, item)) + estimate_tokens(item.page.url) + 4
+        available = budget - used - overhead
+        if available < min(_MIN_SENTENCE_TOKENS, estimate_tokens(item.sentences[best])):
+            continue
+        if estimate_tokens(item.sentences[best]) > available:
+            item.sentences[best] = _truncate(item.sentences[best], available - 1) + "…"
+        used += overhead + estimate_tokens(item.sentences[best])
+        item.selected.add(best)
+        included.append(item)
+    if len(included) == len(kept):
+        # 没有省略的结果，省略说明的预留归还给第二轮
+        used -= estimate_tokens(_omitted(len(kept)))
+
+    # 第二轮：剩余预算按句子相关度（其次结果相关度）分配
+    candidates = sorted(
+        ((item.scores[i], item.relevance, -i, item, i)
+         for item in included for i in range(len(item.sentences)) if i not in item.selected),
+        key=lambda c: c[:3], reverse=True)
+    for _, _, _, item, i in candidates:
+        cost = estimate_tokens(item.sentences[i])
+        if used + cost <= budget:
+            used += cost
+            item.selected.add(i)
+
+    blocks = [title] + [f"{_header(i, item)}\n{_render_text(item)}\n来源：{item.page.url}" for i, item in enumerate(included, 1)]
+    if len(included) < len(kept):
+        blocks.append(_omitted(len(kept) - len(included)))
+    return "\n\n".join(blocks)
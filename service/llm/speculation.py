@@ -0,0 +1,228 @@
+import asyncio
+import json
+import re
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from infra.config.settings import settings
+from infra.logger import logger
+from service.llm.models import ToolCallPlan
+from service.llm.tools import ToolManager
+from service.weather.location_cache import location_cache
+
+# 查询前缀中与城市无关的时间词、语气词
+_FILLER_RE = re.compile(r"^(?:请问|帮我|麻烦|给我|查查|查一下|查询|看看|看一下|想知道|告诉我|"
+                        r"今天|今日|明天|现在|目前|此刻|当前|一下|下)+")
+_CITY_RE = re.compile(r"([一-龥]{2,6}?)(市|区|县)?(?:今天|今日|明天|现在|目前|此刻|当前)?的?"
+                      r"(?:会|有|要)?(?:实时)?(?:天气|气温|温度|下雨|下雪|冷不冷|热不热|预警)")
+_NOT_CITY_CHARS = set("的我你他她它们么吗呢啊吧这那什怎哪谁会有要想知道")
+
+_STORM_RE = re.compile(r"台风|热带风暴|热带气旋|热带低压")
+_WARNING_RE = re.compile(r"预警")
+_WEATHER_RE = re.compile(r"天气|气温|温度|下雨|下雪|冷不冷|热不热")
+_NOW_RE = re.compile(r"现在|实时|目前|此刻|当前")
+_FUNCTIONS_RE = re.compile(r"(?:你|希酱|希)(?:能|会|可以)(?:做|干)(?:些)?什么|有(?:哪些|什么)功能")
+
+
+def _normalize_city(city: str) -> str:
+    city = city.strip()
+    if len(city) > 2 and city[-1] in "市区县":
+        city = city[:-1]
+    return city
+
+
+def _known_city(city: str, suffix: Optional[str]) -> bool:
+    """候选城市名是否可信：带有市、区、县后缀，或已解析过地点（查询或订阅过的城市都会写入地点缓存）"""
+    if suffix:
+        return True
+    hit, location = location_cache.get(city)
+    return hit and location is not None
+
+
+def extract_city(query: str) -> Optional[str]:
+    """从查询中粗略提取城市名，无法确定时返回 None；只返回可信的城市名，避免普通句子被当作城市预取"""
+    for line in query.splitlines():
+        text = re.sub(r"^\d+:\s*", "", line.strip())  # 合并消息中的“用户id: ”前缀
+        text = _FILLER_RE.sub("", text)
+        # 从左到右逐个位置尝试，跳过包含代词、语气词的候选
+        for pos in range(len(text)):
+            m = _CITY_RE.match(text, pos)
+            if not m:
+                continue
+            city = _FILLER_RE.sub("", m.group(1))
+            if len(city) >= 2 and not (set(city) & _NOT_CITY_CHARS) and _known_city(city, m.group(2)):
+                return _normalize_city(city)
+    return None
+
+
+def plan_key(plan: ToolCallPlan) -> Tuple[str, str]:
+    params = dict(plan.tool_parameters or {})
+    if isinstance(params.get("city"), str):
+        params["city"] = _normalize_city(params["city"])
+    return plan.tool_name, json.dumps(params, ensure_ascii=False, sort_keys=True)
+
+
+def _storm_rule(query: str) -> Optional[ToolCallPlan]:
+    if _STORM_RE.search(query):
+        return ToolCallPlan(tool_name="get_active_storms", tool_parameters={})
+    return None
+
+
+def _warning_rule(query: str) -> Optional[ToolCallPlan]:
+    if _WARNING_RE.search(query) and (city := extract_city(query)):
+        return ToolCallPlan(tool_name="get_weather_warning", tool_parameters={"city": city})
+    return None
+
+
+def _weather_rule(query: str) -> Optional[ToolCallPlan]:
+    if _WARNING_RE.search(query) or not _WEATHER_RE.search(query):
+        return None
+    city = extract_city(query)
+    if not city:
+        return None
+    tool_name = "get_now_weather" if _NOW_RE.search(query) else "get_today_weather"
+    return ToolCallPlan(tool_name=tool_name, tool_parameters={"city": city})
+
+
+def _functions_rule(query: str) -> Optional[ToolCallPlan]:
+    if _FUNCTIONS_RE.search(query):
+        return ToolCallPlan(tool_name="show_functions", tool_parameters={})
+    return None
+
+
+SPECULATION_RULES: Dict[str, Callable[[str], Optional[ToolCallPlan]]] = {
+    "storm": _storm_rule,
+    "warning": _warning_rule,
+    "weather": _weather_rule,
+    "functions": _functions_rule,
+}
+
+
+class SpeculativeCalls:
+    """一次对话中预先发起的工具调用，计划确认后取用，其余在结束时丢弃"""
+
+    def __init__(self, speculator: "ToolSpeculator"):
+        self._speculator = speculator
+        self._tasks: Dict[Tuple[str, str], Tuple[str, asyncio.Task]] = {}
+
+    def add(self, rule: str, plan: ToolCallPlan, task: asyncio.Task) -> None:
+        self._tasks[plan_key(plan)] = (rule, task)
+
+    def take(self, plan: ToolCallPlan) -> Optional[asyncio.Task]:
+        item = self._tasks.pop(plan_key(plan), None)
+        if item is None:
+            return None
+        rule, task = item
+        self._speculator.record_hit(rule)
+        return task
+
+    def tool_names(self) -> List[str]:
+        return [tool_name for tool_name, _ in self._tasks]
+
+    def discard(self) -> None:
+        for rule, task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+            self._speculator.record_waste(rule)
+        self._tasks.clear()
+
+    def __len__(self):
+        return len(self._tasks)
+
+
+class ToolSpeculator:
+    """
+    工具预取：根据本地规则（城市+天气、台风等关键词）在意图识别的同时发起可能的工具调用。
+    每轮最多预取 SPECULATION_MAX_CALLS 个，近一小时浪费的调用超过 SPECULATION_MAX_WASTE_PER_HOUR 时暂停预取
+    """
+
+    def __init__(self, tool_manager: ToolManager):
+        self.tool_manager = tool_manager
+        self.stats: Dict[str, Dict[str, int]] = {rule: {"hits": 0, "wastes": 0} for rule in SPECULATION_RULES}
+        self._waste_times: Deque[float] = deque()
+
+    def predict(self, query: str) -> List[Tuple[str, ToolCallPlan]]:
+        plans = []
+        for rule, builder in SPECULATION_RULES.items():
+            plan = builder(query)
+            if plan and plan.tool_name in self.tool_manager.tools:
+                plans.append((rule, plan))
+        return plans[:settings.SPECULATION_MAX_CALLS]
+
+    def start(self, query: str) -> SpeculativeCalls:
+        calls = SpeculativeCalls(self)
+        if not settings.SPECULATION_ENABLED or self._waste_exceeded():
+            return calls
+        for rule, plan in self.predict(query):
+            task = asyncio.create_task(self.tool_manager.invoke_tool(plan))
+            # 被丢弃的预取结果无人等待，避免未取回的异常告警
+            task.add_done_callback(_consume_result)
+            calls.add(rule, plan, task)
+        if len(calls):
+            logger.debug("Speculation", f"预取工具调用 {len(calls)} 个")
+        return calls
+
+    def record_hit(self, rule: str) -> None:
+        self.stats[rule]["hits"] += 1
+
+    def record_waste(self, rule: str) -> None:
+        self.stats[rule]["wastes"] += 1
+        self._waste_times.append(time.monotonic())
+
+    def _waste_exceeded(self) -> bool:
+        expire = time.monotonic() - 3600
+        while self._waste_times and self._waste_times[0] < expire:
+            self._waste_times.popleft()
+        return len(self._waste_times) >= settings.SPECULATION_MAX_WASTE_PER_HOUR
+
+
+class ReplySpeculationStats:
+    """直接回复预测：统计预测回复被采用（win）和被取消（loss）的次数，以及被浪费的 token"""
+
+    def __init__(self):
+        self.wins = 0
+        self.losses = 0
+        self.failures = 0
+        self.wasted_tokens = 0
+
+    async def resolve(self, task: asyncio.Task, use: bool) -> Optional[Tuple[Any, Dict[str, int]]]:
+        """use 为 True 时等待并返回预测回复，否则取消预测；预测失败时返回 None"""
+        if use:
+            try:
+                result = await task
+            except Exception as e:
+                self.failures += 1
+                logger.warn("Speculation", f"预测回复生成失败: {e}")
+                return None
+            self.wins += 1
+            logger.debug("Speculation", f"预测回复被采用，当前胜率 {self.win_rate():.0%}")
+            return result
+
+        self.losses += 1
+        if task.done() and not task.cancelled() and task.exception() is None:
+            # 已经生成完毕，token 已经被消耗
+            self.wasted_tokens += task.result()[1].get("total_tokens", 0)
+        else:
+            task.cancel()
+            task.add_done_callback(_consume_result)
+        logger.debug("Speculation", f"需要调用工具，取消预测回复，当前胜率 {self.win_rate():.0%}")
+        return None
+
+    def win_rate(self) -> float:
+        total = self.wins + self.losses
+        return self.wins / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "wins": self.wins,
+            "losses": self.losses,
+            "failures": self.failures,
+            "win_rate": self.win_rate(),
+            "wasted_tokens": self.wasted_tokens,
+        }
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,156 @@
+import time
+from typing import Dict, Tuple, Any, Optional
+
+from langchain_core.messages import BaseMessage
+from langchain_openai import ChatOpenAI
+
+from infra.config.settings import settings
+from infra.logger import logger
+from service.llm.usage import usage_store
+
+TIER_SMALL = "small"
+TIER_LARGE = "large"
+TIER_AUTO = "auto"
+
+
+class TierStats:
+    """按模型分级记录调用次数、耗时与token用量"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, tier: str, seconds: float, usage: Dict[str, int]) -> None:
+        item = self._stats.setdefault(tier, {
+            "calls": 0,
+            "seconds": 0.0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+        })
+        item["calls"] += 1
+        item["seconds"] += seconds
+        item["input_tokens"] += usage.get("input_tokens", 0)
+        item["output_tokens"] += usage.get("output_tokens", 0)
+        item["total_tokens"] += usage.get("total_tokens", 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for tier, item in self._stats.items():
+            calls = item["calls"] or 1
+            result[tier] = dict(item, avg_seconds=item["seconds"] / calls)
+        return result
+
+
+class ModelRouter:
+    """
+    模型分级路由：
+        small 用于意图识别、闲聊、摘要等简单任务；
+        large 仅在小模型置信度不足、输入过长或工具调用较多时使用。
+    各任务可配置为 small / large / auto / 具体模型名
+    """
+
+    def __init__(self):
+        self.models: Dict[str, str] = {
+            TIER_SMALL: settings.LLM_SMALL_MODEL or settings.LLM_MODEL,
+            TIER_LARGE: settings.LLM_LARGE_MODEL or settings.LLM_MODEL,
+        }
+        self.task_config: Dict[str, str] = {
+            "intent": settings.LLM_INTENT_MODEL,
+            "chat": settings.LLM_CHAT_MODEL,
+            "greeting": settings.LLM_GREETING_MODEL,
+            "summary": settings.LLM_SUMMARY_MODEL,
+            "profile": settings.LLM_PROFILE_MODEL,
+        }
+        self.stats = TierStats()
+        self._llm_cache: Dict[Tuple[str, float], ChatOpenAI] = {}
+
+    def model_name(self, tier: str) -> str:
+        """tier 既可以是分级名，也可以直接是模型名"""
+        return self.models.get(tier, tier)
+
+    def get_llm(self, tier: str, temperature: float = 0.7) -> ChatOpenAI:
+        model = self.model_name(tier)
+        key = (model, temperature)
+        if key not in self._llm_cache:
+            self._llm_cache[key] = ChatOpenAI(
+                api_key=settings.LLM_API_KEY,
+                base_url=settings.LLM_BASE_URL,
+                model=model,
+                max_tokens=512,
+                temperature=temperature,
+                timeout=30.0,
+                streaming=False,
+            )
+        return self._llm_cache[key]
+
+    def resolve(self, task: str) -> str:
+        """返回任务配置的分级（auto 交由具体策略决定，未配置时默认 large）"""
+        return self.task_config.get(task) or TIER_LARGE
+
+    def intent_tier(self, query: str) -> str:
+        tier = self.resolve("intent")
+        if tier == TIER_AUTO:
+            tier = TIER_SMALL
+        if tier == TIER_SMALL and len(query) > settings.LLM_ESCALATE_QUERY_LENGTH:
+            return TIER_LARGE
+        return tier
+
+    def should_escalate_intent(self, tier: str, confidence: Optional[float]) -> bool:
+        """小模型给出的置信度不足（或解析失败）时升级到大模型"""
+        if tier != TIER_SMALL or self.model_name(TIER_SMALL) == self.model_name(TIER_LARGE):
+            return False
+        return confidence is None or confidence < settings.LLM_ESCALATE_CONFIDENCE
+
+    def chat_tier(self, query: str, tool_calls: int = 0, escalated: bool = False) -> str:
+        tier = self.resolve("chat")
+        if tier != TIER_AUTO:
+            return tier
+        if escalated:
+            return TIER_LARGE
+        if len(query) > settings.LLM_ESCALATE_QUERY_LENGTH:
+            return TIER_LARGE
+        if tool_calls >= settings.LLM_ESCALATE_TOOL_CALLS:
+            return TIER_LARGE
+        return TIER_SMALL
+
+    def task_tier(self, task: str) -> str:
+        tier = self.resolve(task)
+        return TIER_SMALL if tier == TIER_AUTO else tier
+
+    @staticmethod
+    def merge_usage(total: Dict[str, int], usage: Dict[str, int]) -> Dict[str, int]:
+        for key, value in usage.items():
+            total[key] = total.get(key, 0) + value
+        return total
+
+    @staticmethod
+    def _usage_of(response: Any) -> Dict[str, int]:
+        usage = getattr(response, "usage_metadata", None) or {}
+        return {
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+        }
+
+    def _record(self, task: str, tier: str, seconds: float, response: Any,
+                group_id: Optional[str]) -> Dict[str, int]:
+        usage = self._usage_of(response)
+        self.stats.record(tier, seconds, usage)
+        usage_store.record(group_id, task, usage, seconds)
+        logger.debug("LLM Tier", f"[{task}] {tier}({self.model_name(tier)}) "
+                                 f"{seconds:.2f}s tokens={usage['total_tokens']}")
+        return usage
+
+    async def ainvoke(self, task: str, tier: str, messages: str | list[BaseMessage],
+                      temperature: float = 0.7, group_id: Optional[str] = None) -> Tuple[Any, Dict[str, int]]:
+        start = time.perf_counter()
+        response = await self.get_llm(tier, temperature).ainvoke(messages)
+        usage = self._record(task, tier, time.perf_counter() - start, response, group_id)
+        return response, usage
+
+    def invoke(self, task: str, tier: str, messages: str | list[BaseMessage],
+               temperature: float = 0.7, group_id: Optional[str] = None) -> Tuple[Any, Dict[str, int]]:
+        start = time.perf_counter()
+        response = self.get_llm(tier, temperature).invoke(messages)
+        usage = self._record(task, tier, time.perf_counter() - start, response, group_id)
+        return response, usage
@@ -0,0 +1,99 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from infra.logger import logger
+from service.llm.models import Tool
+from service.rag.embeddings import DashScopeEmbeddings
+
+# 筛选至少能省掉这么多个工具时才计算查询向量，否则一次远程嵌入调用的延迟得不偿失
+MIN_TOOLS_SAVED = 4
+
+
+def compact_definition(tool: Tool) -> str:
+    """
+    工具定义的紧凑序列化，一行一个工具：
+        工具名(参数:类型*范围 说明, ...)：描述    其中 * 表示必填
+    """
+    properties: Dict[str, Dict] = tool.parameters.get("properties", {})
+    required = set(tool.parameters.get("required", []))
+    params = []
+    for name, schema in properties.items():
+        param = f"{name}:{schema.get('type', 'any')}"
+        if name in required:
+            param += "*"
+        if "minimum" in schema or "maximum" in schema:
+            param += f"[{schema.get('minimum', '')}-{schema.get('maximum', '')}]"
+        if schema.get("description"):
+            param += f" {schema['description']}"
+        params.append(param)
+    return f"{tool.name}({', '.join(params)})：{tool.description}"
+
+
+class ToolSelector:
+    """
+    按查询相关性挑选注入意图识别提示词的工具：
+    工具描述的向量在首次使用时计算并缓存，每次查询只注入最相关的 top_k 个工具。
+    工具总数少于 top_k + MIN_TOOLS_SAVED 时不调用嵌入接口，与向量计算失败时一样注入全部工具
+    """
+
+    def __init__(self, tools: Dict[str, Tool], top_k: int):
+        self.tools = tools
+        self.top_k = top_k
+        self.definitions: Dict[str, str] = {name: compact_definition(tool) for name, tool in tools.items()}
+        self._embeddings: Optional[DashScopeEmbeddings] = None
+        self._tool_names: List[str] = []
+        self._tool_vectors: Optional[np.ndarray] = None
+        self._lock = asyncio.Lock()
+
+    def render(self, names: Iterable[str]) -> str:
+        return "\n".join(self.definitions[name] for name in names if name in self.definitions)
+
+    async def select(self, query: str, always_include: Iterable[str] = ()) -> List[str]:
+        names = list(self.tools)
+        if self.top_k <= 0 or len(names) < self.top_k + MIN_TOOLS_SAVED:
+            return names
+        try:
+            await self._ensure_tool_vectors()
+            query_vector = np.asarray(await self._embed_query(query), dtype=np.float32)
+        except Exception as e:
+            logger.warn("Tool Selector", f"工具相关性计算失败，注入全部工具: {e}")
+            return names
+
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+        scores = self._tool_vectors @ query_vector
+        ranked = [self._tool_names[i] for i in np.argsort(-scores)]
+
+        selected = [name for name in always_include if name in self.tools]
+        limit = max(self.top_k, len(selected))
+        for name in ranked:
+            if len(selected) >= limit:
+                break
+            if name not in selected:
+                selected.append(name)
+        return selected
+
+    async def _embed_query(self, query: str) -> List[float]:
+        return await self._get_embeddings().aembed_query(query)
+
+    def _get_embeddings(self) -> DashScopeEmbeddings:
+        if self._embeddings is None:
+            self._embeddings = DashScopeEmbeddings()
+        return self._embeddings
+
+    async def _ensure_tool_vectors(self) -> None:
+        if self._tool_vectors is not None:
+            return
+        async with self._lock:
+            if self._tool_vectors is not None:
+                return
+            names = list(self.tools)
+            texts = [self.definitions[name] for name in names]
+            vectors = np.asarray(await self._get_embeddings().aembed_documents(texts), dtype=np.float32)
+            await asyncio.to_thread(self._get_embeddings().flush)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+            self._tool_names = names
+            self._tool_vectors = vectors
+            logger.info("Tool Selector", f"已计算 {len(names)} 个工具描述的向量")
+
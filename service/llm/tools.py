@@ -1,11 +1,23 @@
-from typing import Optional, Dict, List
-
-from service.llm.models import Tool, IntentRecognitionResult, ToolCallResult
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional, Dict, List, TYPE_CHECKING
+
+from infra.config.settings import settings
+from service.llm.models import Tool, IntentRecognitionResult, ToolCallResult, ToolCallPlan
+from service.llm.search_compaction import compact_results
+from service.rag.partition import KNOWLEDGE_PARTITION
 from service.rag.service import RAGService
 from service.search.service import SearchService
 from service.weather.models import WeatherResponse, StormResponse, StormItem, StormInfo
 from service.weather.service import WeatherService
 
+if TYPE_CHECKING:
+    from service.llm.speculation import SpeculativeCalls
+
+# 当前对话所在的群，由 LLMService 在每轮对话开始时设置，供需要区分群的工具（如记忆检索）使用
+current_group_id: ContextVar[Optional[str]] = ContextVar("current_group_id", default=None)
+
 
 class ToolManager:
     def __init__(self):
@@ -33,7 +45,7 @@ class ToolManager:
             ),
             "memory_query": Tool(
                 name="memory_query",
-                description="查询机器人个人长期记忆（daily_memory.txt）中的历史记录，当用户问“我以前说过/记过/提到过…”时,"
+                description="查询机器人在本群的长期记忆（每日对话摘要）中的历史记录，当用户问“我以前说过/记过/提到过…”时,"
                             "或用户消息可能涉及到对话历史时、时间点时使用",
                 parameters={
                     "type": "object",
@@ -41,6 +53,14 @@ class ToolManager:
                         "query": {
                             "type": "string",
                             "description": "用户询问的关键词或问题"
+                        },
+                        "date_from": {
+                            "type": "string",
+                            "description": "起始日期YYYY-MM-DD，涉及具体时间时填写"
+                        },
+                        "date_to": {
+                            "type": "string",
+                            "description": "结束日期YYYY-MM-DD，涉及具体时间时填写"
                         }
                     },
                     "required": ["query"]
@@ -136,7 +156,9 @@ class ToolManager:
             )
         }
 
-    async def call_tools(self, recognition_result: IntentRecognitionResult) -> List[ToolCallResult]:
+    async def call_tools(self, recognition_result: IntentRecognitionResult,
+                         speculation: Optional["SpeculativeCalls"] = None) -> List[ToolCallResult]:
+        """按调用计划依次调用工具，计划与预取结果一致时直接使用预取结果"""
         results = []
         if not recognition_result.should_call_tool or not recognition_result.tool_calls:
             results.append(ToolCallResult(
@@ -149,42 +171,52 @@ class ToolManager:
             return results
 
         for call_plan in recognition_result.tool_calls:
-            tool_name = call_plan.tool_name
-            if tool_name not in self.tools:
-                results.append(ToolCallResult(
-                    tool_name=tool_name,
-                    parameters=call_plan.tool_parameters or {},
-                    success=False,
-                    result=None,
-                    error=f"工具不存在: {tool_name}"
-                ))
-                continue
-
-            try:
-                tool = self.tools[tool_name]
-                result = await tool.invoke(call_plan.tool_parameters or {})
-                results.append(ToolCallResult(
-                    tool_name=tool_name,
-                    parameters=call_plan.tool_parameters or {},
-                    success=True,
-                    result=result
-                ))
-            except Exception as e:
-                results.append(ToolCallResult(
-                    tool_name=tool_name,
-                    parameters=call_plan.tool_parameters or {},
-                    success=False,
-                    result=None,
-                    error=str(e)
-                ))
+            prefetched = speculation.take(call_plan) if speculation else None
+            if prefetched is not None:
+                results.append(await prefetched)
+            else:
+                results.append(await self.invoke_tool(call_plan))
 
         return results
 
+    async def invoke_tool(self, call_plan: ToolCallPlan) -> ToolCallResult:
+        tool_name = call_plan.tool_name
+        if tool_name not in self.tools:
+            return ToolCallResult(
+                tool_name=tool_name,
+                parameters=call_plan.tool_parameters or {},
+                success=False,
+                result=None,
+                error=f"工具不存在: {tool_name}"
+            )
+
+        start = time.perf_counter()
+        try:
+            tool = self.tools[tool_name]
+            result = await tool.invoke(call_plan.tool_parameters or {})
+            return ToolCallResult(
+                tool_name=tool_name,
+                parameters=call_plan.tool_parameters or {},
+                success=True,
+                result=result,
+                elapsed=time.perf_counter() - start
+            )
+        except Exception as e:
+            return ToolCallResult(
+                tool_name=tool_name,
+                parameters=call_plan.tool_parameters or {},
+                success=False,
+                result=None,
+                error=str(e),
+                elapsed=time.perf_counter() - start
+            )
+
 
 async def rag_query(query: str, top_k: int = 3) -> str:
     try:
-        rag_service = RAGService()
-        results = rag_service.query(query, top_k)
+        rag_service = await asyncio.to_thread(RAGService.shared)
+        # 只检索知识库分区，不涉及各群的记忆
+        results = await rag_service.aquery_with_filter(query, {"partition": KNOWLEDGE_PARTITION}, top_k)
 
         if not results:
             raise Exception("未找到相关文档信息")
@@ -198,14 +230,15 @@ async def rag_query(query: str, top_k: int = 3) -> str:
         raise Exception(f"查询失败：{str(e)}")
 
 
-async def memory_query(query: str) -> str:
+async def memory_query(query: str, date_from: Optional[str] = None, date_to: Optional[str] = None) -> str:
     """
-    调用 RAGService 的 query_for_memory 方法，
-    仅搜索 daily_memory.txt 中的记忆片段
+    调用 RAGService 的 aquery_for_memory 方法，
+    仅搜索当前群、指定日期范围内的记忆分片
     """
     try:
-        rag = RAGService()
-        memories = rag.query_for_memory(query)
+        rag = await asyncio.to_thread(RAGService.shared)
+        memories = await rag.aquery_for_memory(query, group_id=current_group_id.get(),
+                                               date_from=date_from or None, date_to=date_to or None)
         if not memories:
             return "没有找到相关记忆片段。"
 
@@ -350,20 +383,17 @@ async def get_active_storms() -> str:
 
 async def web_search(query: str, count: int = 10) -> str:
     try:
-        search_service = SearchService()
+        search_service = SearchService.shared()
 
-        # 调用search_for_text方法获取文本片段列表
-        text_summaries = await search_service.search_for_text(query, count)
+        results = await search_service.search(query, count)
+        # 去除转载的重复结果，按相关度抽取句子，控制注入提示词的篇幅
+        compacted = compact_results(query, results, settings.WEB_SEARCH_TOKEN_BUDGET,
+                                    settings.WEB_SEARCH_DEDUP_DISTANCE)
 
-        if not text_summaries:
+        if not compacted:
             raise Exception(f"未找到与 '{query}' 相关的文本内容")
 
-        # 格式化结果
-        result = [f"与 '{query}' 相关的搜索结果："]
-        for i, snippet in enumerate(text_summaries, 1):
-            result.append(f"\n【结果 {i}】\n{snippet}")
-
-        return "\n".join(result)
+        return compacted
 
     except Exception as e:
         raise Exception(f"搜索文本内容时发生错误：{str(e)}")
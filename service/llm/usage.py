@@ -0,0 +1,130 @@
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Literal
+from zoneinfo import ZoneInfo
+
+from infra.config.settings import settings
+from infra.logger import logger
+
+BudgetLevel = Literal["normal", "degraded", "exhausted"]
+
+GLOBAL_GROUP = "global"  # 不属于任何群的调用（如未指定群的后台任务）
+
+
+class UsageStore:
+    """
+    LLM 与工具用量统计，按 日期 -> 群 -> 任务 聚合并持久化到本地，
+    每项记录调用次数、token 用量和耗时
+    """
+
+    def __init__(self, json_file: str = "cache/llm_usage.json", keep_days: int = 31, save_interval: float = 10.0):
+        self.json_file = json_file
+        self.keep_days = keep_days
+        self.save_interval = save_interval
+        self._lock = threading.Lock()  # 摘要任务会在线程中同步调用
+        self._last_save = 0.0
+        self.usage: Dict[str, Dict[str, Dict[str, Dict[str, float]]]] = self.load_usage(json_file)
+
+    @staticmethod
+    def load_usage(json_file: str) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        if not os.path.exists(json_file):
+            return {}
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warn("Usage", f"用量记录读取失败: {e}")
+            return {}
+
+    def save_usage(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.json_file), exist_ok=True)
+            tmp_file = f"{self.json_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(self.usage, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.json_file)
+            self._last_save = time.monotonic()
+        except Exception as e:
+            logger.warn("Usage", f"保存用量记录失败: {e}")
+
+    def flush(self) -> None:
+        """在锁内保存，供退出时等外部调用；record 持有锁时直接调用 save_usage"""
+        with self._lock:
+            self.save_usage()
+
+    @staticmethod
+    def today() -> str:
+        return datetime.now(tz=ZoneInfo("Asia/Shanghai")).strftime("%Y-%m-%d")
+
+    def record(self, group_id: Optional[str], task: str, usage: Optional[Dict[str, int]] = None,
+               seconds: float = 0.0) -> None:
+        usage = usage or {}
+        group_key = str(group_id) if group_id is not None else GLOBAL_GROUP
+        with self._lock:
+            day = self.usage.setdefault(self.today(), {})
+            item = day.setdefault(group_key, {}).setdefault(task, {
+                "calls": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "total_tokens": 0,
+                "seconds": 0.0,
+            })
+            item["calls"] += 1
+            item["input_tokens"] += usage.get("input_tokens", 0)
+            item["output_tokens"] += usage.get("output_tokens", 0)
+            item["total_tokens"] += usage.get("total_tokens", 0)
+            item["seconds"] = round(item["seconds"] + seconds, 3)
+
+            self._prune()
+            if time.monotonic() - self._last_save >= self.save_interval:
+                self.save_usage()
+
+    def _prune(self) -> None:
+        expire = (datetime.now(tz=ZoneInfo("Asia/Shanghai")) - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        for date in [d for d in self.usage if d < expire]:
+            del self.usage[date]
+
+    def group_report(self, group_id: Optional[str], date: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """某群某日按任务聚合的用量"""
+        group_key = str(group_id) if group_id is not None else GLOBAL_GROUP
+        return self.usage.get(date or self.today(), {}).get(group_key, {})
+
+    def daily_report(self, date: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """某日按群聚合的用量"""
+        report = {}
+        for group_key, tasks in self.usage.get(date or self.today(), {}).items():
+            report[group_key] = {
+                "calls": sum(t["calls"] for t in tasks.values()),
+                "total_tokens": sum(t["total_tokens"] for t in tasks.values()),
+                "seconds": round(sum(t["seconds"] for t in tasks.values()), 3),
+            }
+        return report
+
+    def tokens_today(self, group_id: Optional[str]) -> int:
+        return int(sum(t["total_tokens"] for t in self.group_report(group_id).values()))
+
+    def budget_level(self, group_id: Optional[str]) -> BudgetLevel:
+        """
+        按群每日 token 预算给出降级等级：
+            normal    正常
+            degraded  超过降级比例，只使用小模型
+            exhausted 超出预算，只使用小模型且禁用工具
+        """
+        budget = settings.LLM_GROUP_DAILY_TOKEN_BUDGET
+        if budget <= 0 or group_id is None:
+            return "normal"
+        used = self.tokens_today(group_id)
+        if used >= budget:
+            return "exhausted"
+        if used >= budget * settings.LLM_BUDGET_DEGRADE_RATIO:
+            return "degraded"
+        return "normal"
+
+
+usage_store = UsageStore()
+# record 最多每 save_interval 秒保存一次，退出时保存最后一段时间的用量
+atexit.register(usage_store.flush)
@@ -0,0 +1,214 @@
+"""
+RAG 离线检索评测：使用确定性的本地嵌入（HashingEmbeddings）与合成语料，不访问网络。
+对每种索引配置报告 recall@k、MRR、建索引耗时、查询 p50/p99 延迟与内存占用，并可按阈值做回归检查。
+
+    python -m service.rag.benchmark                                  # 全部配置
+    python -m service.rag.benchmark --configs flat hnsw --docs 200   # 指定配置与语料规模
+    python -m service.rag.benchmark --check                          # 低于阈值时以非零状态退出
+
+合成语料由若干主题的填充句、每段独有的关键词与事实句（"<实体>的<属性>是<值>。"）组成，
+查询由段落关键词加上对实体属性的提问构成，命中包含该实体的切块即为相关结果
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from infra.config.settings import settings
+from .embeddings import HashingEmbeddings
+from .service import RAGService
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 各配置相对默认设置的覆盖项；评测时关闭查询缓存，保证每次查询都实际检索
+CONFIGS: Dict[str, Dict[str, Any]] = {
+    "flat": {"RAG_INDEX_TYPE": "flat", "RAG_HYBRID_ENABLED": False},
+    "flat_hybrid": {"RAG_INDEX_TYPE": "flat", "RAG_HYBRID_ENABLED": True},
+    "flat_sq8": {"RAG_INDEX_TYPE": "flat", "RAG_HYBRID_ENABLED": False, "RAG_KNOWLEDGE_QUANTIZATION": "sq8"},
+    "hnsw": {"RAG_INDEX_TYPE": "hnsw", "RAG_HYBRID_ENABLED": False},
+    "ivf_flat": {"RAG_INDEX_TYPE": "ivf_flat", "RAG_HYBRID_ENABLED": False},
+}
+_NO_CACHE = {"RAG_QUERY_EMBEDDING_CACHE_SIZE": 0, "RAG_RESULT_CACHE_SIZE": 0}
+
+# 回归阈值 (最低 recall@5, 最低 MRR)：默认语料参数下各配置的基线结果留出少量余量，
+# 语料参数或 top_k 不同时应通过 --min-recall / --min-mrr 显式指定
+THRESHOLDS: Dict[str, Tuple[float, float]] = {
+    "flat": (0.70, 0.58),
+    "flat_hybrid": (0.95, 0.82),
+    "flat_sq8": (0.70, 0.58),
+    "hnsw": (0.60, 0.52),
+    "ivf_flat": (0.70, 0.58),
+}
+DEFAULT_MAX_P99_MS = 200.0
+
+_ATTRIBUTES = ["颜色", "产地", "重量", "编号", "负责人", "创始年份", "口味", "材质"]
+
+
+@dataclass
+class LabelledQuery:
+    question: str
+    marker: str  # 相关切块必须包含的文本
+
+
+def _word(rng: random.Random, length: int) -> str:
+    return "".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(length))
+
+
+def generate_corpus(docs_dir: str, docs: int = 100, paragraphs: int = 20, topics: int = 10,
+                    queries: int = 200, seed: int = 0) -> List[LabelledQuery]:
+    """在 docs_dir 中写入合成文档，返回带标注的查询集"""
+    rng = random.Random(seed)
+    topic_words = [[_word(rng, 2) for _ in range(30)] for _ in range(topics)]
+    facts = []
+    os.makedirs(docs_dir, exist_ok=True)
+    for doc in range(docs):
+        words = topic_words[doc % topics]
+        blocks = []
+        for _ in range(paragraphs):
+            # 每段有自己的关键词，在段内多次出现，查询由关键词与事实组成
+            keywords = [_word(rng, 2) for _ in range(3)]
+            sentences = ["".join(rng.choice(words) for _ in range(8)) for _ in range(12)]
+            for keyword in keywords * 2:
+                position = rng.randrange(len(sentences))
+                sentences[position] += keyword
+            entity = _word(rng, 4)
+            attribute = rng.choice(_ATTRIBUTES)
+            value = _word(rng, 3)
+            blocks.append("。".join(sentences) + f"。{entity}的{attribute}是{value}。")
+            facts.append((entity, attribute, keywords))
+        with open(os.path.join(docs_dir, f"doc_{doc:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(blocks))
+    return [LabelledQuery(f"{''.join(keywords)}，{entity}的{attribute}是什么？", entity)
+            for entity, attribute, keywords in rng.sample(facts, min(queries, len(facts)))]
+
+
+@contextmanager
+def override_settings(**overrides: Any) -> Iterator[None]:
+    original = {key: getattr(settings, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+    try:
+        yield
+    finally:
+        for key, value in original.items():
+            setattr(settings, key, value)
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_config(name: str, corpus_dir: str, queries: List[LabelledQuery], top_k: int = 5,
+               dim: int = 512) -> Dict[str, Any]:
+    """在语料副本上以指定配置建立索引并执行全部查询"""
+    work_dir = tempfile.mkdtemp(prefix=f"rag_bench_{name}_")
+    try:
+        docs_dir = os.path.join(work_dir, "docs")
+        shutil.copytree(corpus_dir, docs_dir)
+        with override_settings(**CONFIGS[name], **_NO_CACHE):
+            start = time.perf_counter()
+            service = RAGService(docs_dir, embeddings=HashingEmbeddings(dim))
+            service.check_and_update_documents()
+            build_s = time.perf_counter() - start
+
+            latencies, hits, reciprocal_ranks = [], 0, []
+            for query in queries:
+                start = time.perf_counter()
+                results = service.query(query.question, top_k=top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                rank = next((i for i, r in enumerate(results, 1) if query.marker in r["content"]), None)
+                hits += rank is not None
+                reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+            chunks = sum(partition.ntotal for partition in service.partitions.values())
+            service.close()
+
+        return {
+            "config": name,
+            "chunks": chunks,
+            f"recall@{top_k}": hits / len(queries),
+            "mrr": float(np.mean(reciprocal_ranks)),
+            "build_s": build_s,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "index_mb": _dir_size(service.index_dir) / 1024 / 1024,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def check_thresholds(result: Dict[str, Any], top_k: int, min_recall: float, min_mrr: float,
+                     max_p99_ms: float) -> List[str]:
+    """返回未达到阈值的指标说明，全部达标时为空列表"""
+    failures = []
+    if result[f"recall@{top_k}"] < min_recall:
+        failures.append(f"recall@{top_k} {result[f'recall@{top_k}']:.3f} < {min_recall}")
+    if result["mrr"] < min_mrr:
+        failures.append(f"MRR {result['mrr']:.3f} < {min_mrr}")
+    if result["p99_ms"] > max_p99_ms:
+        failures.append(f"p99 {result['p99_ms']:.1f}ms > {max_p99_ms}ms")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="RAG 离线检索评测")
+    parser.add_argument("--configs", nargs="+", choices=sorted(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="按阈值检查，未达标时以状态码 1 退出")
+    parser.add_argument("--min-recall", type=float, help="覆盖各配置的 recall 阈值")
+    parser.add_argument("--min-mrr", type=float, help="覆盖各配置的 MRR 阈值")
+    parser.add_argument("--max-p99-ms", type=float, default=DEFAULT_MAX_P99_MS)
+    args = parser.parse_args()
+
+    corpus_dir = tempfile.mkdtemp(prefix="rag_bench_corpus_")
+    failed = False
+    try:
+        queries = generate_corpus(corpus_dir, args.docs, args.paragraphs, queries=args.queries, seed=args.seed)
+        print(f"语料 {args.docs} 篇 × {args.paragraphs} 段，查询 {len(queries)} 条，top_k={args.top_k}")
+        print(f"{'配置':<14}{'切块':>8}{'recall':>9}{'MRR':>8}{'构建(s)':>10}{'p50(ms)':>10}"
+              f"{'p99(ms)':>10}{'索引(MB)':>10}{'峰值RSS(MB)':>13}")
+        for name in args.configs:
+            result = run_config(name, corpus_dir, queries, args.top_k, args.dim)
+            rss = result["peak_rss_mb"]
+            print(f"{name:<14}{result['chunks']:>8}{result[f'recall@{args.top_k}']:>9.3f}{result['mrr']:>8.3f}"
+                  f"{result['build_s']:>10.2f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                  f"{result['index_mb']:>10.2f}{rss if rss is None else round(rss, 1):>13}")
+            if args.check:
+                min_recall, min_mrr = THRESHOLDS[name]
+                failures = check_thresholds(result, args.top_k,
+                                            min_recall if args.min_recall is None else args.min_recall,
+                                            min_mrr if args.min_mrr is None else args.min_mrr, args.max_p99_ms)
+                for failure in failures:
+                    print(f"  ✗ {name}: {failure}")
+                failed = failed or bool(failures)
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
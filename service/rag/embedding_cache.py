@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from infra.logger import logger
+
+
+def _today() -> int:
+    """以天为单位的时间戳，用于记录最近使用时间"""
+    return int(time.time() // 86400)
+
+
+class EmbeddingCache:
+    """
+    持久化的内容寻址嵌入缓存：
+        键为 模型名 + 文本内容的哈希，同一模型的向量按行连续存放在 vectors.bin 中（float16 或 float32），
+        index.json 记录 键 -> [行号, 最近使用日期]。长时间未使用的条目在保存时被淘汰并压缩文件
+    """
+
+    def __init__(self, cache_dir: str, model: str, dtype: str = "float16", max_idle_days: int = 30):
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.max_idle_days = max_idle_days
+        self.cache_dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model))
+        self.vectors_file = os.path.join(self.cache_dir, "vectors.bin")
+        self.index_file = os.path.join(self.cache_dir, "index.json")
+
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.entries: Dict[str, List[int]] = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.index_file) or not os.path.exists(self.vectors_file):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warn("Embedding Cache", f"嵌入缓存索引读取失败，将重新建立: {e}")
+            return
+        if np.dtype(data.get("dtype", "float32")) != self.dtype:
+            logger.info("Embedding Cache", "嵌入缓存精度配置变更，重新建立缓存")
+            return
+        self.dim = data.get("dim")
+        self.entries = data.get("entries", {})
+        rows = os.path.getsize(self.vectors_file) // (self.dim * self.dtype.itemsize) if self.dim else 0
+        if any(entry[0] >= rows for entry in self.entries.values()):
+            logger.warn("Embedding Cache", "嵌入缓存文件不完整，重新建立缓存")
+            self.dim = None
+            self.entries = {}
+
+    def _open_vectors(self) -> np.memmap:
+        rows = os.path.getsize(self.vectors_file) // (self.dim * self.dtype.itemsize)
+        return np.memmap(self.vectors_file, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """批量查询，未命中的位置为 None"""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            if not self.entries or self.dim is None:
+                return results
+            today = _today()
+            hits: List[Tuple[int, int]] = []
+            for i, text in enumerate(texts):
+                entry = self.entries.get(self.key(text))
+                if entry is not None:
+                    hits.append((i, entry[0]))
+                    if entry[1] != today:
+                        entry[1] = today
+                        self._dirty = True
+            if not hits:
+                return results
+
+            vectors = self._open_vectors()
+            for i, row in hits:
+                results[i] = vectors[row].astype(np.float32).tolist()
+            del vectors
+        return results
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        if not texts:
+            return
+        array = np.asarray(embeddings, dtype=self.dtype)
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self.dim is None:
+                # 新建缓存，丢弃可能残留的旧向量文件
+                self.dim = array.shape[1]
+                open(self.vectors_file, "wb").close()
+            elif array.shape[1] != self.dim:
+                logger.warn("Embedding Cache", f"向量维度 {array.shape[1]} 与缓存维度 {self.dim} 不一致，跳过缓存")
+                return
+            today = _today()
+            new_rows = []
+            # 以文件实际行数为准，索引未及时保存时多出的行不会被错误复用
+            row_bytes = self.dim * self.dtype.itemsize
+            next_row = os.path.getsize(self.vectors_file) // row_bytes if os.path.exists(self.vectors_file) else 0
+            for text, vector in zip(texts, array):
+                key = self.key(text)
+                if key in self.entries:
+                    continue
+                self.entries[key] = [next_row, today]
+                new_rows.append(vector)
+                next_row += 1
+            if new_rows:
+                with open(self.vectors_file, "ab") as f:
+                    f.write(np.stack(new_rows).tobytes())
+                self._dirty = True
+
+    def save(self, min_interval: float = 0.0) -> None:
+        """保存索引，并淘汰超过 max_idle_days 未使用的条目；距上次保存不足 min_interval 秒时跳过"""
+        with self._lock:
+            if time.monotonic() - self._last_save < min_interval:
+                return
+            self._last_save = time.monotonic()
+            self._evict()
+            if not self._dirty:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = f"{self.index_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype.name, "entries": self.entries}, f)
+            os.replace(tmp_file, self.index_file)
+            self._dirty = False
+
+    def _evict(self) -> None:
+        if self.max_idle_days <= 0 or not self.entries or self.dim is None:
+            return
+        expire = _today() - self.max_idle_days
+        kept = {key: entry for key, entry in self.entries.items() if entry[1] >= expire}
+        if len(kept) == len(self.entries):
+            return
+
+        vectors = self._open_vectors()
+        rows = [entry[0] for entry in kept.values()]
+        compacted = np.asarray(vectors[rows]) if rows else np.empty((0, self.dim), dtype=self.dtype)
+        del vectors
+        tmp_file = f"{self.vectors_file}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(compacted.tobytes())
+        os.replace(tmp_file, self.vectors_file)
+
+        logger.info("Embedding Cache", f"淘汰 {len(self.entries) - len(kept)} 条长期未使用的嵌入缓存")
+        self.entries = {key: [row, entry[1]] for row, (key, entry) in enumerate(kept.items())}
+        self._dirty = True
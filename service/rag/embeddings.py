@@ -1,20 +1,183 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 from dashscope import TextEmbedding
 from langchain_core.embeddings import Embeddings
 
 from infra.config.settings import settings
+from infra.logger import logger
+from .embedding_cache import EmbeddingCache
+from .lexical import tokenize
+
+BATCH_SIZE = 10  # 接口单次请求的最大文本数
+
+
+class _RateLimiter:
+    """线程安全的令牌桶，限制每秒发起的嵌入请求数"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _QueryBatcher:
+    """
+    查询向量的微批合并：等待窗口内并发的 aembed_query 请求合并为一次接口调用（最多 BATCH_SIZE 条），
+    相同文本只计算一次
+    """
+
+    def __init__(self, client: "DashScopeEmbeddings", window: float):
+        self.client = client
+        self.window = window
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending = {}
+            self._timer = None
+
+        future = self._pending.get(text)
+        if future is None:
+            future = loop.create_future()
+            self._pending[text] = future
+            if len(self._pending) >= BATCH_SIZE:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self._loop.create_task(self._run(batch))
+
+    async def _run(self, batch: Dict[str, asyncio.Future]) -> None:
+        texts = list(batch)
+        try:
+            vectors = await asyncio.to_thread(self.client.call_batch, texts)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(Exception(f"生成查询嵌入时出错: {str(e)}"))
+            return
+        if len(texts) > 1:
+            logger.debug("Embeddings", f"合并 {len(texts)} 个查询为一次嵌入请求")
+        for text, vector in zip(texts, vectors):
+            if not batch[text].done():
+                batch[text].set_result(vector)
 
 
 class DashScopeEmbeddings(Embeddings):
-    def __init__(self):
+    # 同一模型、同一密钥的实例共享限流器与查询合并队列，不同工具调用的并发查询也能合并
+    _shared: Dict[Tuple[str, str], Tuple[_RateLimiter, _QueryBatcher]] = {}
+    # 同一目录、同一模型的实例共享一个嵌入缓存，避免各自保存索引时互相覆盖、压缩文件后行号错位
+    _shared_caches: Dict[Tuple[str, str], EmbeddingCache] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, use_cache: bool = True):
         self.model = settings.EMBEDDINGS_MODEL
         self.api_key = settings.EMBEDDINGS_API_KEY
+        self.concurrency = max(1, settings.EMBEDDINGS_CONCURRENCY)
+        self.max_retries = max(0, settings.EMBEDDINGS_MAX_RETRIES)
+        # 文档嵌入的持久化缓存，相同模型、相同内容的切块不会重复调用接口
+        self.cache: Optional[EmbeddingCache] = None
+
+        with self._shared_lock:
+            key = (self.model, self.api_key)
+            if key not in self._shared:
+                self._shared[key] = (_RateLimiter(settings.EMBEDDINGS_RATE_LIMIT),
+                                     _QueryBatcher(self, settings.EMBEDDINGS_BATCH_WINDOW))
+            self._rate_limiter, self._query_batcher = self._shared[key]
+            if use_cache and settings.EMBEDDINGS_CACHE_DIR:
+                cache_key = (os.path.abspath(settings.EMBEDDINGS_CACHE_DIR), self.model)
+                if cache_key not in self._shared_caches:
+                    self._shared_caches[cache_key] = EmbeddingCache(
+                        settings.EMBEDDINGS_CACHE_DIR,
+                        self.model,
+                        dtype=settings.EMBEDDINGS_CACHE_DTYPE,
+                        max_idle_days=settings.EMBEDDINGS_CACHE_MAX_IDLE_DAYS,
+                    )
+                self.cache = self._shared_caches[cache_key]
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        embeddings = []
-        batch_size = 10
+        if self.cache is None:
+            return self._embed_documents(texts)
+
+        embeddings = self.cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            missing_embeddings = self._embed_documents(missing_texts)
+            for i, embedding in zip(missing, missing_embeddings):
+                embeddings[i] = embedding
+            self.cache.put_many(missing_texts, missing_embeddings)
+            # 新向量已追加写入文件，索引定期保存即可；调用方在一轮处理结束时调用 flush 落盘
+            self.cache.save(min_interval=settings.EMBEDDINGS_CACHE_SAVE_INTERVAL)
+        return embeddings
+
+    def flush(self) -> None:
+        """保存嵌入缓存索引（包括命中条目的最近使用日期）"""
+        if self.cache is not None:
+            self.cache.save()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
 
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
+    def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """按 BATCH_SIZE 切分，多个批次在受限流控制的线程池中并发请求，结果保持原顺序"""
+        batches = [texts[i:i + BATCH_SIZE] for i in range(0, len(texts), BATCH_SIZE)]
+        if not batches:
+            return []
+        try:
+            if len(batches) == 1 or self.concurrency == 1:
+                results = [self.call_batch(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches)),
+                                        thread_name_prefix="embedding") as executor:
+                    results = list(executor.map(self.call_batch, batches))
+        except Exception as e:
+            raise Exception(f"生成文档嵌入时出错: {str(e)}")
+        return [embedding for result in results for embedding in result]
+
+    def call_batch(self, batch: List[str]) -> List[List[float]]:
+        """
+        单次接口调用，限流后发起请求；网络异常、限流（429）和服务端错误按指数退避加随机抖动重试
+        """
+        for attempt in range(self.max_retries + 1):
+            self._rate_limiter.acquire()
+            retryable = True
             try:
                 response = TextEmbedding.call(
                     api_key=self.api_key,
@@ -22,23 +185,49 @@ class DashScopeEmbeddings(Embeddings):
                     input=batch
                 )
                 if response.status_code == 200:
-                    embeddings.extend([record['embedding'] for record in response.output['embeddings']])
-                else:
-                    raise Exception(f"嵌入模型调用失败: {response.message}")
+                    return [record['embedding'] for record in response.output['embeddings']]
+                retryable = response.status_code == 429 or response.status_code >= 500
+                error = Exception(f"嵌入模型调用失败: {response.message}")
             except Exception as e:
-                raise Exception(f"生成文档嵌入时出错: {str(e)}")
-        return embeddings
+                error = e
+            if not retryable or attempt == self.max_retries:
+                raise error
+            delay = min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warn("Embeddings", f"嵌入请求失败，{delay:.1f} 秒后重试（{attempt + 1}/{self.max_retries}）: {error}")
+            time.sleep(delay)
+        return []
 
     def embed_query(self, text: str) -> list[float]:
         try:
-            response = TextEmbedding.call(
-                api_key=self.api_key,
-                model=self.model,
-                input=[text]
-            )
-            if response.status_code == 200:
-                return response.output['embeddings'][0]['embedding']
-            else:
-                raise Exception(f"嵌入模型调用失败: {response.message}")
+            return self.call_batch([text])[0]
         except Exception as e:
             raise Exception(f"生成查询嵌入时出错: {str(e)}")
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self._query_batcher.embed(text)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    确定性的本地嵌入：字符 n-gram 按次数对数缩放后特征哈希到 dim 维（哈希值决定桶与符号），再归一化。
+    不依赖网络与模型，相同文本在任何进程中得到相同向量，用于离线评测与回归测试
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        # 对数缩放词频，避免高频词主导向量
+        for token, count in Counter(tokenize(text, with_unigrams=True)).items():
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            weight = 1.0 + math.log(count)
+            vector[digest % self.dim] += weight if digest >> 63 else -weight
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
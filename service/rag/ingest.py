@@ -0,0 +1,155 @@
+"""
+流式文档摄取：按块读取文件，在段落边界处切成互不重叠的文本段，文本段可以分发到多个进程并行切块，
+切块按原顺序逐个产出，调用方边产出边嵌入。单个文件同时驻留内存的只有少量文本段，与文件大小无关
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import Executor
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Deque, Dict, Iterator, List, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# 支持的文档格式：扩展名 -> 格式
+DOCUMENT_FORMATS: Dict[str, str] = {
+    ".txt": "text",
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".html": "html",
+    ".htm": "html",
+    ".jsonl": "jsonl",
+}
+
+_SEPARATORS = ["\n\n", "\n", "。", "，", " ", ""]
+# Markdown 优先在标题处切分
+_MARKDOWN_SEPARATORS = ["\n# ", "\n## ", "\n### ", "\n#### ", *_SEPARATORS]
+# jsonl 记录中依次尝试作为正文的字段
+_JSONL_TEXT_FIELDS = ("text", "content", "summary", "body")
+_HTML_SKIP_TAGS = {"script", "style", "head", "noscript"}
+_HTML_BLOCK_TAGS = {"p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article",
+                    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote"}
+
+
+def document_format(file_name: str) -> Optional[str]:
+    return DOCUMENT_FORMATS.get(os.path.splitext(file_name)[1].lower())
+
+
+class _HTMLText(HTMLParser):
+    """增量提取 HTML 正文：跳过脚本与样式，块级标签转为段落分隔"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HTML_SKIP_TAGS:
+            self._skip += 1
+        elif tag in _HTML_BLOCK_TAGS:
+            self._parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag in _HTML_SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _HTML_BLOCK_TAGS:
+            self._parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._parts.append(data)
+
+    def drain(self) -> str:
+        text = "".join(self._parts)
+        self._parts.clear()
+        return text
+
+
+def _record_text(line: str) -> str:
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return line
+    if not isinstance(record, dict):
+        return str(record)
+    for field in _JSONL_TEXT_FIELDS:
+        if isinstance(record.get(field), str):
+            return record[field]
+    return "\n".join(f"{key}: {value}" for key, value in record.items() if isinstance(value, (str, int, float)))
+
+
+def iter_text(path: str, fmt: str, read_chars: int) -> Iterator[str]:
+    """按块读取文件并转为纯文本片段"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        if fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield _record_text(line.strip()) + "\n\n"
+        elif fmt == "html":
+            parser = _HTMLText()
+            while block := f.read(read_chars):
+                parser.feed(block)
+                yield parser.drain()
+            parser.close()
+            yield parser.drain()
+        else:
+            while block := f.read(read_chars):
+                yield block
+
+
+def _boundary(text: str, limit: int) -> int:
+    # 在后半段中寻找最靠后的段落、换行或句子边界，找不到时硬切
+    for separator in ("\n\n", "\n", "。", " "):
+        position = text.rfind(separator, limit // 2, limit)
+        if position > 0:
+            return position + len(separator)
+    return limit
+
+
+def iter_segments(path: str, fmt: str, segment_chars: int) -> Iterator[str]:
+    """将文件切成约 segment_chars 字的文本段，段与段之间在段落边界处断开、互不重叠，可以独立切块"""
+    buffer = ""
+    for piece in iter_text(path, fmt, segment_chars):
+        buffer += piece
+        while len(buffer) >= segment_chars:
+            cut = _boundary(buffer, segment_chars)
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer.strip():
+        yield buffer
+
+
+@lru_cache(maxsize=8)
+def _splitter(fmt: str, chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=_MARKDOWN_SEPARATORS if fmt == "markdown" else _SEPARATORS
+    )
+
+
+def split_segment(text: str, fmt: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """切分一个文本段（在子进程中执行）"""
+    return _splitter(fmt, chunk_size, chunk_overlap).split_text(text)
+
+
+def iter_chunks(path: str, fmt: str, chunk_size: int, chunk_overlap: int, segment_chars: int,
+                pool: Optional[Executor] = None, prefetch: int = 4) -> Iterator[str]:
+    """
+    按顺序产出文件的切块文本。提供进程池时，最多 prefetch 个文本段同时在子进程中切分，
+    调用方处理已产出切块的同时后续文本段仍在并行切分
+    """
+    segments = iter_segments(path, fmt, segment_chars)
+    if pool is None:
+        for segment in segments:
+            yield from split_segment(segment, fmt, chunk_size, chunk_overlap)
+        return
+
+    pending: Deque = deque()
+    for segment in segments:
+        pending.append(pool.submit(split_segment, segment, fmt, chunk_size, chunk_overlap))
+        if len(pending) >= prefetch:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
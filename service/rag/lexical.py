@@ -0,0 +1,122 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[一-龥]+")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str, with_unigrams: bool = False) -> List[str]:
+    """
+    字符 n-gram 分词：中文连续片段切为相邻二字组（单字片段保留单字），
+    英文单词与数字整体作为一个词，适合人名、ID、日期等精确匹配。
+    索引文档时 with_unigrams 为 True，额外收录单字，使单字查询也能命中
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if run[0].isascii() or len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if with_unigrams:
+            tokens.extend(run)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    基于字符 n-gram 的 BM25 倒排索引，与向量索引同步维护：
+        postings   词 -> {切块ID: 词频}
+        doc_terms  切块ID -> {词: 词频}，用于删除切块时撤销倒排项
+    lexical.json 只保存 doc_terms，加载时完整读入内存并重建倒排表
+    """
+
+    def __init__(self, path: str):
+        self.file = os.path.join(path, "lexical.json")
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.file):
+            return False
+        with open(self.file, "r", encoding="utf-8") as f:
+            doc_terms = json.load(f)
+        for chunk_id, terms in doc_terms.items():
+            self._index(chunk_id, terms)
+        return True
+
+    def save(self) -> None:
+        tmp_file = f"{self.file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.doc_terms, f, ensure_ascii=False)
+        os.replace(tmp_file, self.file)
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def _index(self, chunk_id: str, terms: Dict[str, int]) -> None:
+        self.doc_terms[chunk_id] = terms
+        length = sum(terms.values())
+        self.doc_lengths[chunk_id] = length
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+
+    def add(self, chunk_id: str, text: str) -> None:
+        if chunk_id in self.doc_terms:
+            self.remove(chunk_id)
+        self._index(chunk_id, dict(Counter(tokenize(text, with_unigrams=True))))
+
+    def remove(self, chunk_id: str) -> None:
+        terms = self.doc_terms.pop(chunk_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(chunk_id, 0)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str) -> List[Tuple[str, float, float]]:
+        """
+        BM25 检索，返回按得分降序的 (切块ID, 得分, 覆盖率)，
+        覆盖率为切块中出现的查询词占全部不同查询词的比例
+        """
+        terms = set(tokenize(query))
+        total = len(self.doc_terms)
+        if not terms or not total:
+            return []
+        avg_length = self.total_length / total or 1.0
+        scores: Dict[str, float] = {}
+        matched: Dict[str, int] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched[chunk_id] = matched.get(chunk_id, 0) + 1
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(chunk_id, score, matched[chunk_id] / len(terms)) for chunk_id, score in ranked]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """倒数排名融合：score = Σ 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: scores[key], reverse=True)
@@ -0,0 +1,58 @@
+import json
+import os
+import threading
+from typing import Dict, List
+
+from infra.logger import logger
+from .partition import split_memory_sections
+
+
+class MemoryStore:
+    """
+    长期记忆的分片存储：<root>/<群号>/<YYYY-MM>.jsonl，每行一条每日摘要 {"date", "group_id", "summary"}。
+    RAGService 将每个分片索引到 群 + 月 的记忆分区，检索时只访问相关分片
+    """
+
+    def __init__(self, root: str = "rag_docs/memory"):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def shard_path(self, group_id: str, date: str) -> str:
+        return os.path.join(self.root, str(group_id), f"{date[:7]}.jsonl")
+
+    def append(self, group_id: str, date: str, summary: str) -> None:
+        path = self.shard_path(group_id, date)
+        record = {"date": date, "group_id": str(group_id), "summary": summary}
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def read_shard(path: str) -> List[Dict[str, str]]:
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warn("Memory Store", f"跳过无法解析的记忆记录: {path}")
+        return records
+
+    def migrate_legacy(self, legacy_file: str) -> int:
+        """将旧版 daily_memory.txt 按日期与群拆分写入分片，原文件重命名为 .migrated 保留"""
+        if not os.path.exists(legacy_file):
+            return 0
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            sections = split_memory_sections(f.read())
+        for date, group_id, summary in sections:
+            self.append(group_id, date, summary)
+        os.replace(legacy_file, f"{legacy_file}.migrated")
+        logger.info("Memory Store", f"已将 {len(sections)} 条旧版记忆迁移到分片存储")
+        return len(sections)
+
+
+memory_store = MemoryStore()
@@ -0,0 +1,90 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MEMORY_FILE = "daily_memory.txt"  # 旧版记忆文件，启动时迁移到分片记忆存储
+MEMORY_DIR = "memory"
+KNOWLEDGE_PARTITION = "knowledge"
+MEMORY_PARTITION_PREFIX = "memory_"
+# 记忆相关的过滤条件，由分区路由处理
+MEMORY_FILTER_KEYS = ("group_id", "date_from", "date_to")
+
+_DATE_RE = re.compile(r"^日期：(\d{4}-\d{2}-\d{2})\s*$", re.MULTILINE)
+_GROUP_RE = re.compile(r"^【群 (\S+?)】\s*$", re.MULTILINE)
+
+
+def memory_partition(group_id: str, date: str) -> str:
+    """记忆按 群 + 月 分区：memory_<群号>_<YYYYMM>"""
+    return f"{MEMORY_PARTITION_PREFIX}{group_id}_{date[:7].replace('-', '')}"
+
+
+def parse_memory_partition(partition: str) -> Optional[Tuple[str, str]]:
+    """解析记忆分区名，返回 (群号, YYYY-MM)，非记忆分区返回 None"""
+    if not partition.startswith(MEMORY_PARTITION_PREFIX):
+        return None
+    group_id, _, month = partition[len(MEMORY_PARTITION_PREFIX):].rpartition("_")
+    if not group_id or len(month) != 6 or not month.isdigit():
+        return None
+    return group_id, f"{month[:4]}-{month[4:]}"
+
+
+def is_memory_partition(partition: str) -> bool:
+    return parse_memory_partition(partition) is not None
+
+
+def split_memory_sections(text: str) -> List[Tuple[str, str, str]]:
+    """
+    将 daily_memory.txt 按 日期 与 【群 id】 拆分为 (日期, 群号, 摘要) 列表，
+    无法识别群号的内容归入群号 "unknown"
+    """
+    sections = []
+    dates = list(_DATE_RE.finditer(text))
+    for i, date_match in enumerate(dates):
+        block = text[date_match.end():dates[i + 1].start() if i + 1 < len(dates) else len(text)]
+        groups = list(_GROUP_RE.finditer(block))
+        if not groups and block.strip("=\n "):
+            sections.append((date_match.group(1), "unknown", block.strip("=\n ")))
+        for j, group_match in enumerate(groups):
+            content = block[group_match.end():groups[j + 1].start() if j + 1 < len(groups) else len(block)]
+            content = content.strip("=\n ")
+            if content:
+                sections.append((date_match.group(1), group_match.group(1), content))
+    return sections
+
+
+def route_filter(query_filter: Optional[Dict[str, str]],
+                 partitions: Iterable[str]) -> Tuple[List[str], Optional[Dict[str, str]]]:
+    """
+    根据过滤条件选择需要检索的分区，返回 (分区列表, 分区内仍需执行的过滤条件)：
+        partition                      -> 指定分区
+        group_id / date_from / date_to -> 该群、该日期范围所在月份的记忆分区（日期范围在分区内再精确过滤）
+        file_name=记忆文件              -> 所有记忆分区
+        其他 file_name                 -> 知识库分区
+        无过滤条件                      -> 全部分区
+    """
+    partitions = list(partitions)
+    if not query_filter:
+        return partitions, None
+
+    remaining = dict(query_filter)
+    if "partition" in remaining:
+        target = remaining.pop("partition")
+        selected = [target] if target in partitions else []
+    elif any(key in remaining for key in MEMORY_FILTER_KEYS) or remaining.get("file_name") == MEMORY_FILE:
+        if remaining.get("file_name") == MEMORY_FILE:
+            remaining.pop("file_name")
+        group_id = remaining.pop("group_id", None)
+        month_from = remaining.get("date_from", "")[:7]
+        month_to = remaining.get("date_to", "")[:7]
+        selected = []
+        for partition in partitions:
+            parsed = parse_memory_partition(partition)
+            if parsed is None or (group_id is not None and parsed[0] != str(group_id)):
+                continue
+            if (month_from and parsed[1] < month_from) or (month_to and parsed[1] > month_to):
+                continue
+            selected.append(partition)
+    elif "file_name" in remaining:
+        selected = [p for p in partitions if p == KNOWLEDGE_PARTITION]
+    else:
+        selected = partitions
+    return selected, remaining or None
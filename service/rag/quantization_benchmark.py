@@ -0,0 +1,115 @@
+"""
+向量压缩的召回率与内存评估：以精确检索（flat）的结果为基准，比较各索引布局的 recall@k、索引大小、构建耗时与查询延迟。
+
+    python -m service.rag.quantization_benchmark                                  # 合成聚类向量
+    python -m service.rag.quantization_benchmark --partition rag_index/knowledge  # 已有分区的向量
+
+已有分区若已量化，取回的是解码后的近似向量，基准本身也带有量化误差
+"""
+import argparse
+import time
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from .vector_index import (INDEX_FLAT, INDEX_HNSW, INDEX_IVF_FLAT, QUANT_FP16, QUANT_NONE, QUANT_PQ, QUANT_SQ8,
+                           Layout, PartitionIndex, _tune, build_index, choose_layout)
+
+
+def default_layouts(dim: int) -> List[Layout]:
+    pca_dim = dim // 4
+    return [
+        (INDEX_FLAT, QUANT_NONE, 0),
+        (INDEX_FLAT, QUANT_FP16, 0),
+        (INDEX_FLAT, QUANT_SQ8, 0),
+        (INDEX_FLAT, QUANT_PQ, 0),
+        (INDEX_FLAT, QUANT_SQ8, pca_dim),
+        (INDEX_HNSW, QUANT_NONE, 0),
+        (INDEX_HNSW, QUANT_SQ8, 0),
+        (INDEX_HNSW, QUANT_PQ, 0),
+        (INDEX_IVF_FLAT, QUANT_SQ8, 0),
+    ]
+
+
+def synthetic_vectors(size: int, dim: int, clusters: int = 32, seed: int = 0) -> np.ndarray:
+    """高斯混合分布的归一化向量，模拟主题聚集的文本嵌入"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def partition_vectors(path: str) -> np.ndarray:
+    partition = PartitionIndex.load(path)
+    return partition._reconstruct_all(partition.index.d)[1]
+
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, layouts: Optional[List[Layout]] = None,
+             k: int = 10) -> List[Dict[str, object]]:
+    """
+    对每个布局构建索引并检索，返回 {layout, recall, bytes, bytes_per_vector, build_s, query_ms}；
+    训练样本不足的布局按 choose_layout 的退回规则构建，layout 为实际使用的布局
+    """
+    size, dim = vectors.shape
+    k = min(k, size)
+    ids = np.arange(size, dtype=np.int64)
+    truth = faiss.IndexFlatL2(dim)
+    truth.add(vectors)
+    _, expected = truth.search(queries, k)
+
+    results = []
+    for layout in layouts or default_layouts(dim):
+        index_type, quantization, pca_dim = choose_layout(size, dim, layout[1], layout[2], layout[0])
+        start = time.perf_counter()
+        index = build_index(index_type, dim, vectors, quantization, pca_dim)
+        index.add_with_ids(vectors, ids)
+        _tune(index, index_type)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        hits = sum(len(set(row_found) & set(row_expected)) for row_found, row_expected in zip(found, expected))
+        nbytes = faiss.serialize_index(index).nbytes
+        results.append({
+            "layout": (index_type, quantization, pca_dim),
+            "recall": hits / (k * len(queries)),
+            "bytes": int(nbytes),
+            "bytes_per_vector": nbytes / size,
+            "build_s": build_s,
+            "query_ms": query_ms,
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="评估向量压缩布局的召回率与内存占用")
+    parser.add_argument("--partition", help="已有分区目录，不指定时使用合成向量")
+    parser.add_argument("--size", type=int, default=20000, help="合成向量数量")
+    parser.add_argument("--dim", type=int, default=1024, help="合成向量维度")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.partition:
+        vectors = partition_vectors(args.partition)
+        rng = np.random.default_rng(0)
+        # 从分区中抽样并加入少量扰动作为查询
+        queries = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = (queries + 0.05 * rng.standard_normal(queries.shape)).astype(np.float32)
+    else:
+        data = synthetic_vectors(args.size + args.queries, args.dim)
+        vectors, queries = data[:args.size], data[args.size:]
+
+    print(f"向量 {len(vectors)} 条，维度 {vectors.shape[1]}，查询 {len(queries)} 条，k={args.k}")
+    print(f"{'布局':<28}{'recall@k':>10}{'大小(MB)':>12}{'字节/向量':>12}{'构建(s)':>10}{'查询(ms)':>10}")
+    for row in evaluate(vectors, queries, k=args.k):
+        layout = "/".join(str(part) for part in row["layout"])
+        print(f"{layout:<28}{row['recall']:>10.3f}{row['bytes'] / 1024 / 1024:>12.2f}"
+              f"{row['bytes_per_vector']:>12.1f}{row['build_s']:>10.2f}{row['query_ms']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,150 +1,446 @@
+import asyncio
 import hashlib
 import json
+import multiprocessing
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from typing_extensions import deprecated
 
 from .embeddings import DashScopeEmbeddings
+from .ingest import document_format, iter_chunks
+from .lexical import reciprocal_rank_fusion
+from .memory_store import MemoryStore
+from .partition import (KNOWLEDGE_PARTITION, MEMORY_DIR, MEMORY_FILE, is_memory_partition, memory_partition,
+                        route_filter)
+from .query_cache import LRUCache, normalize_query
+from .vector_index import PartitionIndex
+from infra.config.settings import settings
 from infra.logger import logger
 
 
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+CHECKSUM_READ_SIZE = 1 << 20
+# 修改时间距今不足该时长（纳秒）的文件不记录 stat，下次检查时重新哈希
+STAT_SETTLE_NS = 2_000_000_000
+# 嵌入进度的汇报粒度（切块数）
+EMBED_PROGRESS_STEP = 100
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """优先创建硬链接，文件系统不支持时退回复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
 class RAGService:
-    def __init__(self, docs_dir: str = "rag_docs"):
+    """
+    RAG 检索服务。进程内通过 RAGService.shared() 复用同一个实例，
+    后台线程定期扫描文档的 stat 信息，发现变更后交给索引线程在暂存目录中构建新分区并原子替换，
+    构建期间查询继续使用旧分区，查询只需一次向量化和一次向量检索。
+    索引按来源分区存放在 index/<分区>/ 下：知识库文档为 knowledge，记忆按群分为 memory_<群号>，
+    带过滤条件的查询直接路由到对应分区，跨分区查询按距离合并结果
+    """
+    _instances: Dict[str, "RAGService"] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, docs_dir: str = "rag_docs") -> "RAGService":
+        """获取 docs_dir 对应的长驻实例，首次调用时创建并启动文档监视"""
+        key = os.path.abspath(docs_dir)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                instance = cls(docs_dir)
+                instance.start_watcher(settings.RAG_WATCH_INTERVAL)
+                cls._instances[key] = instance
+            return cls._instances[key]
+
+    @classmethod
+    def peek_shared(cls, docs_dir: str = "rag_docs") -> Optional["RAGService"]:
+        """获取已创建的长驻实例，不存在时不创建"""
+        return cls._instances.get(os.path.abspath(docs_dir))
+
+    def __init__(self, docs_dir: str = "rag_docs", embeddings: Optional[Embeddings] = None):
         self.docs_dir = docs_dir
         self.index_dir = os.path.join(docs_dir, "index")
-        self.checksum_file = os.path.join(docs_dir, "document_checksums.json")  # 检查文档状态
-
-        self.embeddings = DashScopeEmbeddings()
+        # 分区先在暂存目录中更新，替换时旧分区移入回收目录后删除
+        self.staging_dir = os.path.join(self.index_dir, ".staging")
+        self.trash_dir = os.path.join(self.index_dir, ".trash")
+        # 索引清单：每个文档的校验和及其各分区的切块ID，用于增量更新
+        self.manifest_file = os.path.join(docs_dir, "index_manifest.json")
+
+        # 默认使用 DashScope 嵌入，离线评测时可传入本地嵌入（如 HashingEmbeddings）
+        self.embeddings = embeddings or DashScopeEmbeddings()
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
             separators=["\n\n", "\n", "。", "，", " ", ""]
         )
 
-        os.makedirs(self.docs_dir, exist_ok=True)
-        self.document_checksums = self._load_checksums()
-        self.vector_store = self._load_or_rebuild_vector_store()
-
-    def _load_or_rebuild_vector_store(self) -> FAISS:
-        current_docs = self._get_all_documents()
+        self._store_lock = threading.Lock()  # 保护分区的替换与检索
+        # 索引更新在单个后台线程中串行执行；排队中的更新会合并，后续请求复用同一个 Future
+        self._indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-indexer")
+        self._job_lock = threading.Lock()
+        self._queued_update: Optional[Future] = None
+        self._progress: Dict[str, Any] = {"state": "idle", "stage": "", "done": 0, "total": 0,
+                                          "started_at": None, "finished_at": None, "changes": None, "error": None}
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_stop = threading.Event()
+
+        # 查询缓存：查询向量按归一化查询缓存；检索结果的键包含索引版本，索引变更后旧结果自动失效
+        self.index_version = 0
+        self.query_embedding_cache = LRUCache(settings.RAG_QUERY_EMBEDDING_CACHE_SIZE)
+        self.result_cache = LRUCache(settings.RAG_RESULT_CACHE_SIZE)
+        self.lexical_shortcuts = 0
 
-        # 如果索引不存在，直接创建
-        if not os.path.exists(self.index_dir):
-            return self._build_vector_store(current_docs)
-
-        # 检查是否有文档变化
-        if self._has_document_changes(current_docs):
-            logger.info("RAG", "检测到文档变更，重新建立索引。")
-            # 删除旧索引
+        os.makedirs(self.docs_dir, exist_ok=True)
+        # 旧版 daily_memory.txt 迁移到按 群/月 分片的记忆存储
+        MemoryStore(os.path.join(self.docs_dir, MEMORY_DIR)).migrate_legacy(os.path.join(self.docs_dir, MEMORY_FILE))
+        self.manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
+        self._stat_snapshot: Dict[str, Tuple[int, int, int]] = {}
+        self.partitions: Dict[str, PartitionIndex] = self._load_or_rebuild_partitions()
+        # 加载后在后台按清单增量同步文档变更，首次建立索引也不阻塞调用方
+        self.schedule_update()
+
+    def _load_or_rebuild_partitions(self) -> Dict[str, PartitionIndex]:
+        self.partitions = {}
+        self._recover_staging()
+        # 索引或清单缺失、或为旧版格式（未分区、pickle 切块存储）时，全部重新建立
+        legacy = (os.path.exists(os.path.join(self.index_dir, "index.faiss"))
+                  or any(isinstance(entry.get("chunks"), list) for entry in self.manifest.values())
+                  or any(os.path.exists(os.path.join(self.index_dir, partition, "index.pkl"))
+                         for partition in (os.listdir(self.index_dir) if os.path.isdir(self.index_dir) else [])))
+        if not os.path.exists(self.index_dir) or not self.manifest or legacy:
+            logger.info("RAG", "索引不存在、缺少清单或为未分区格式，重新建立索引。")
             if os.path.exists(self.index_dir):
                 shutil.rmtree(self.index_dir)
-            # 重建新索引
-            return self._build_vector_store(current_docs)
-
-        # 索引存在且无变化，直接加载
-        return FAISS.load_local(
-            self.index_dir,
-            self.embeddings,
-            allow_dangerous_deserialization=True
-        )
-
-    def _build_vector_store(self, docs_list: List[str]) -> FAISS:
-        """基于当前文档列表构建新索引"""
-        if not docs_list:
-            # 空文档时创建占位文档
-            placeholder_doc = Document(
-                page_content="",
-                metadata={"source": "placeholder"}
+            self.manifest = {}
+        else:
+            for partition in sorted(os.listdir(self.index_dir)):
+                partition_dir = os.path.join(self.index_dir, partition)
+                if os.path.isdir(partition_dir) and not partition.startswith("."):
+                    self.partitions[partition] = PartitionIndex.load(partition_dir, *self._compression(partition))
+        return self.partitions
+
+    def _recover_staging(self) -> None:
+        """清理上次中断的构建：丢弃暂存目录；替换到一半中断时原位已空，将回收目录中的旧分区移回"""
+        if os.path.exists(self.staging_dir):
+            shutil.rmtree(self.staging_dir)
+        if not os.path.exists(self.trash_dir):
+            return
+        for partition in os.listdir(self.trash_dir):
+            live_dir = os.path.join(self.index_dir, partition)
+            if not os.path.exists(live_dir):
+                os.replace(os.path.join(self.trash_dir, partition), live_dir)
+        shutil.rmtree(self.trash_dir)
+
+    @property
+    def document_checksums(self) -> Dict[str, str]:
+        return {doc_name: entry["checksum"] for doc_name, entry in self.manifest.items()}
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file, "r", encoding="utf-8") as file:
+            try:
+                return json.load(file)
+            except json.JSONDecodeError:
+                return {}
+
+    def _save_manifest(self) -> None:
+        # 写入临时文件并落盘后原子替换，中断时保留旧清单
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file, self.manifest_file)
+
+    def _iter_splits(self, doc_name: str, pool: Optional[Executor] = None) -> Iterator[Document]:
+        """
+        流式加载并切分单个文档，为每个切块生成稳定ID：文档名 + 切块内容哈希（同一文档内重复内容追加序号），
+        文档追加或局部修改时，未变化的切块ID保持不变。
+        记忆分片中的每条每日摘要单独切块，切块带有 date、group_id 元数据并归入对应 群 + 月 的记忆分区；
+        其他文档按格式转为纯文本后分段读取、切块（提供进程池时并行切块），归入知识库分区
+        """
+        file_path = os.path.join(self.docs_dir, doc_name)
+        if doc_name.startswith(f"{MEMORY_DIR}/"):
+            texts = (
+                ({"source": file_path, "file_name": Path(file_path).name, "date": record["date"],
+                  "group_id": record["group_id"], "partition": memory_partition(record["group_id"], record["date"])},
+                 text)
+                for record in MemoryStore.read_shard(file_path)
+                for text in self.text_splitter.split_text(
+                    f"日期：{record['date']}\n【群 {record['group_id']}】\n{record['summary']}")
             )
-            return FAISS.from_documents([placeholder_doc], self.embeddings)
-
-        # 加载所有文档
-        loader = DirectoryLoader(
-            self.docs_dir,
-            glob="*.txt",
-            loader_cls=TextLoader,
-            loader_kwargs={"encoding": "utf-8"},
-        )
-        documents = loader.load()
-
-        # 分割文档并创建索引、保存校验和
-        documents = [self._enrich_metadata(d) for d in documents]
-        splits = self.text_splitter.split_documents(documents)
-        vector_store = FAISS.from_documents(splits, self.embeddings)
-        vector_store.save_local(self.index_dir)
-        self._save_checksums()
-        return vector_store
-
-    def _has_document_changes(self, current_docs: List[str]) -> bool:
-        """检查文档是否有变更"""
-        # 检查已删除的文档
-        for doc_name in self.document_checksums:
-            if doc_name not in current_docs:
-                return True
-
-        # 检查新增或修改的文档
-        for doc_name in current_docs:
-            file_path = os.path.join(self.docs_dir, doc_name)
-            current_checksum = self._calculate_checksum(file_path)
-
-            # 新增文档
-            if doc_name not in self.document_checksums:
-                return True
-
-            # 修改的文档
-            if self.document_checksums[doc_name] != current_checksum:
-                return True
-
-        return False
-
-    def _load_checksums(self) -> Dict[str, str]:
-        if os.path.exists(self.checksum_file):
-            with open(self.checksum_file, "r", encoding="utf-8") as file:
-                try:
-                    return json.load(file)
-                except json.JSONDecodeError:
-                    return {}
-        with open(self.checksum_file, "w", encoding="utf-8") as file:
-            json.dump({}, file, ensure_ascii=False, indent=2)
-        return {}
-
-    def _save_checksums(self) -> None:
-        checksums = {}
-        current_docs = self._get_all_documents()
-
-        # 为所有当前存在的文档计算新的校验和
-        for doc_name in current_docs:
+        else:
+            metadata = {"source": file_path, "file_name": Path(file_path).name, "partition": KNOWLEDGE_PARTITION}
+            chunks = iter_chunks(file_path, document_format(doc_name), CHUNK_SIZE, CHUNK_OVERLAP,
+                                 settings.RAG_INGEST_SEGMENT_CHARS, pool)
+            texts = ((metadata, text) for text in chunks)
+
+        seen: Dict[str, int] = {}
+        for metadata, text in texts:
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+            chunk_id = f"{doc_name}:{digest}"
+            seen[chunk_id] = seen.get(chunk_id, 0) + 1
+            if seen[chunk_id] > 1:
+                chunk_id = f"{chunk_id}:{seen[chunk_id]}"
+            yield Document(id=chunk_id, page_content=text, metadata={**metadata, "chunk_id": chunk_id})
+
+    def _ingest_pool(self, doc_names: List[str]) -> Optional[Executor]:
+        """待切分的知识库文档足够大时创建切块进程池（spawn 方式，避免在多线程进程中 fork）"""
+        workers = settings.RAG_INGEST_WORKERS or os.cpu_count() or 1
+        if workers <= 1:
+            return None
+        total = sum(os.path.getsize(os.path.join(self.docs_dir, doc_name)) for doc_name in doc_names
+                    if not doc_name.startswith(f"{MEMORY_DIR}/"))
+        if total < settings.RAG_INGEST_PARALLEL_MIN_MB * 1024 * 1024:
+            return None
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _sync_documents(self, stats: Optional[Dict[str, Tuple[int, int, int]]] = None) -> Dict[str, int]:
+        """
+        对比文档与清单，只对变化的文档做增量更新（stats 为 _scan_stats 的结果，未提供时重新扫描）：
+            清单中的 stat（大小、修改时间、inode）与当前一致的文档不读取内容；
+            删除的文档删除其全部切块；新增、修改的文档只嵌入新出现的切块，并删除不再存在的切块
+        切块边切分边积攒，攒满一批即嵌入并写入索引，首批写入后即可检索，之后每批数量翻倍以减少分区替换次数，
+        翻倍到 RAG_INGEST_COMMIT_MAX_CHUNKS 为止。
+        文档的清单记录在包含其最后一个切块的批次写入索引后才更新并保存，嵌入或写入失败时
+        未完成的文档保持原记录，下次同步从最后一个成功的批次之后继续
+        返回变更统计: 新增、更新、删除的文档数量
+        """
+        changes = {
+            "added": 0,
+            "updated": 0,
+            "removed": 0
+        }
+        stats = self._scan_stats() if stats is None else stats
+        manifest_dirty = False
+        to_delete: List[Tuple[str, str]] = []
+        to_add: List[Document] = []
+        # 切块已进入待写入批次、尚未写入索引的文档的新清单记录（None 表示删除）
+        pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        commit_size = max(1, settings.RAG_INGEST_COMMIT_CHUNKS)
+        # 每批上限决定了待写入切块与其向量的峰值内存
+        max_commit_size = max(commit_size, settings.RAG_INGEST_COMMIT_MAX_CHUNKS)
+
+        def commit() -> None:
+            nonlocal commit_size
+            if to_add or to_delete:
+                self._apply_chunk_changes(to_add, to_delete)
+                logger.info("RAG", f"索引增量更新：新增切块 {len(to_add)} 个，删除切块 {len(to_delete)} 个")
+                to_add.clear()
+                to_delete.clear()
+                commit_size = min(commit_size * 2, max_commit_size)
+            if pending:
+                for doc_name, entry in pending.items():
+                    if entry is None:
+                        self.manifest.pop(doc_name, None)
+                    else:
+                        self.manifest[doc_name] = entry
+                pending.clear()
+                self._save_manifest()
+
+        # 删除的文档
+        for doc_name in list(self.manifest):
+            if doc_name not in stats:
+                changes["removed"] += 1
+                to_delete.extend(self._manifest_chunks(self.manifest[doc_name]))
+                pending[doc_name] = None
+
+        # 新增和修改的文档：stat 未变化的文档直接跳过，变化时才计算内容哈希
+        changed: List[Tuple[str, str, Optional[List[int]]]] = []
+        for doc_name, stat in stats.items():
+            entry = self.manifest.get(doc_name)
+            if entry and entry.get("stat") == list(stat):
+                continue
             file_path = os.path.join(self.docs_dir, doc_name)
-            checksums[doc_name] = self._calculate_checksum(file_path)
+            checksum = self._calculate_checksum(file_path)
+            recorded = self._stable_stat(stat)
+            if entry and "stat" not in entry and entry["checksum"] == self._legacy_checksum(file_path):
+                # 旧版清单只有 MD5，内容未变时直接升级为新格式，无需重新切分
+                entry["checksum"] = checksum
+            if entry and entry["checksum"] == checksum:
+                # 仅 stat 变化（如 touch、复制）而内容未变，只更新记录的 stat
+                entry["stat"] = recorded
+                manifest_dirty = True
+                continue
+            changed.append((doc_name, checksum, recorded))
+
+        pool = self._ingest_pool([doc_name for doc_name, _, _ in changed]) if changed else None
+        try:
+            for i, (doc_name, checksum, recorded) in enumerate(changed):
+                self._set_progress(stage="split", done=i, total=len(changed))
+                entry = self.manifest.get(doc_name)
+                changes["updated" if entry else "added"] += 1
+                old_keys = set(self._manifest_chunks(entry)) if entry else set()
+                new_keys = set()
+                chunks: Dict[str, List[str]] = {}
+                for split in self._iter_splits(doc_name, pool):
+                    key = (split.metadata["partition"], split.id)
+                    new_keys.add(key)
+                    chunks.setdefault(key[0], []).append(split.id)
+                    if key not in old_keys:
+                        to_add.append(split)
+                        if len(to_add) >= commit_size:
+                            commit()
+                to_delete.extend(old_keys - new_keys)
+                pending[doc_name] = {"checksum": checksum, "stat": recorded, "chunks": chunks}
+                if not to_add and not to_delete:
+                    # 最后一个切块已随上一批写入，立即记录
+                    commit()
+            commit()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if isinstance(self.embeddings, DashScopeEmbeddings):
+                self.embeddings.flush()
+
+        if manifest_dirty and not any(changes.values()):
+            self._save_manifest()
+        return changes
 
-        # 更新内存中的校验和
-        self.document_checksums = checksums
+    @staticmethod
+    def _manifest_chunks(entry: Dict[str, Any]) -> List[Tuple[str, str]]:
+        return [(partition, chunk_id) for partition, ids in entry["chunks"].items() for chunk_id in ids]
+
+    def _apply_chunk_changes(self, to_add: List[Document], to_delete: List[Tuple[str, str]]) -> None:
+        # 嵌入分批完成以便汇报进度；分区在暂存目录中更新，锁内只做目录与对象的替换，不阻塞检索
+        self._set_progress(stage="embed", done=0, total=len(to_add))
+        vectors: List[List[float]] = []
+        for start in range(0, len(to_add), EMBED_PROGRESS_STEP):
+            batch = to_add[start:start + EMBED_PROGRESS_STEP]
+            vectors.extend(self.embeddings.embed_documents([doc.page_content for doc in batch]))
+            self._set_progress(done=len(vectors))
+        additions: Dict[str, List[Tuple[Document, List[float]]]] = {}
+        for doc, vector in zip(to_add, vectors):
+            additions.setdefault(doc.metadata["partition"], []).append((doc, vector))
+        deletions: Dict[str, List[str]] = {}
+        for partition, chunk_id in to_delete:
+            deletions.setdefault(partition, []).append(chunk_id)
+
+        changed = sorted(set(additions) | set(deletions))
+        self._set_progress(stage="build", done=0, total=len(changed))
+        staged: Dict[str, Optional[PartitionIndex]] = {}
+        for i, partition in enumerate(changed):
+            staged[partition] = self._stage_partition(partition, additions.get(partition, []),
+                                                      deletions.get(partition, []))
+            self._set_progress(done=i + 1)
+
+        self._set_progress(stage="swap")
+        with self._store_lock:
+            for partition, store in staged.items():
+                self._swap_partition(partition, store)
+            self.index_version += 1
+            self.result_cache.clear()
+        for directory in (self.trash_dir, self.staging_dir):
+            shutil.rmtree(directory, ignore_errors=True)
 
-        # 保存到文件
-        with open(self.checksum_file, "w", encoding="utf-8") as file:
-            json.dump(checksums, file, ensure_ascii=False, indent=2)
+    @staticmethod
+    def _compression(partition: str) -> Tuple[str, int]:
+        """分区的 (量化方式, PCA 维度)：记忆分区数量随群与月份增长，默认压缩；知识库默认保持全精度"""
+        if is_memory_partition(partition):
+            return settings.RAG_MEMORY_QUANTIZATION, settings.RAG_MEMORY_PCA_DIM
+        return settings.RAG_KNOWLEDGE_QUANTIZATION, settings.RAG_KNOWLEDGE_PCA_DIM
+
+    def _stage_partition(self, partition: str, additions: List[Tuple[Document, List[float]]],
+                         deletions: List[str]) -> Optional[PartitionIndex]:
+        """
+        在暂存目录中生成分区的新版本并保存，返回新分区（分区被清空时返回 None）。
+        暂存目录以硬链接复制现有分区：索引与元数据文件都以 临时文件 + 替换 的方式写入，
+        切块文本只追加或整体替换，不会改动旧分区正在读取的内容
+        """
+        staging_dir = os.path.join(self.staging_dir, partition)
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+        if partition in self.partitions:
+            shutil.copytree(os.path.join(self.index_dir, partition), staging_dir, copy_function=_link_or_copy)
+            store = PartitionIndex.load(staging_dir, *self._compression(partition))
+        else:
+            if not additions:
+                return None
+            store = PartitionIndex(staging_dir, *self._compression(partition))
+        store.delete(deletions)
+        store.add([doc for doc, _ in additions], [vector for _, vector in additions])
+        if store.ntotal == 0:
+            # 分区清空后删除，避免检索空索引
+            store.close()
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return None
+        store.save()
+        return store
+
+    def _swap_partition(self, partition: str, store: Optional[PartitionIndex]) -> None:
+        """用暂存的新分区替换线上分区：旧目录移入回收目录，新目录重命名到原位（需持有 _store_lock）"""
+        live_dir = os.path.join(self.index_dir, partition)
+        old = self.partitions.pop(partition, None)
+        if old is not None:
+            old.close()
+        if os.path.exists(live_dir):
+            os.makedirs(self.trash_dir, exist_ok=True)
+            os.replace(live_dir, os.path.join(self.trash_dir, partition))
+        if store is not None:
+            store.move_to(live_dir)
+            self.partitions[partition] = store
 
     @staticmethod
     def _calculate_checksum(file_path: str) -> str:
+        """BLAKE2b 内容哈希，以 1 MB 为单位读取"""
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(file_path, "rb") as file:
+            while chunk := file.read(CHECKSUM_READ_SIZE):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _legacy_checksum(file_path: str) -> str:
+        """旧版清单使用的 MD5 校验和，仅用于迁移"""
         hasher = hashlib.md5()
         with open(file_path, "rb") as file:
-            while chunk := file.read(4096):
+            while chunk := file.read(CHECKSUM_READ_SIZE):
                 hasher.update(chunk)
-        return hasher.hexdigest()  # 计算MD5校验和
+        return hasher.hexdigest()
 
-    def _get_all_documents(self) -> List[str]:
-        """获取文档目录中所有的txt文件"""
-        return [file for file in os.listdir(self.docs_dir)
-                if file.endswith(".txt") and os.path.isfile(os.path.join(self.docs_dir, file))]
+    @staticmethod
+    def _stable_stat(stat: Tuple[int, int, int]) -> Optional[List[int]]:
+        """
+        刚修改过的文件不记录 stat：同一时间精度内的再次写入不会改变修改时间，
+        下次检查时重新计算哈希，避免漏掉变更
+        """
+        if time.time_ns() - stat[1] < STAT_SETTLE_NS:
+            return None
+        return list(stat)
 
-    @deprecated("Use _load_or_rebuild_vector_store() instead")
+    def _get_all_documents(self) -> List[str]:
+        """获取文档目录中所有受支持格式的文档（txt、md、html、jsonl），以及记忆目录下的分片（memory/<群号>/<YYYY-MM>.jsonl）"""
+        documents = [file for file in os.listdir(self.docs_dir)
+                     if document_format(file) is not None and os.path.isfile(os.path.join(self.docs_dir, file))]
+        memory_dir = os.path.join(self.docs_dir, MEMORY_DIR)
+        if os.path.isdir(memory_dir):
+            for group_id in sorted(os.listdir(memory_dir)):
+                group_dir = os.path.join(memory_dir, group_id)
+                if not os.path.isdir(group_dir):
+                    continue
+                documents.extend(f"{MEMORY_DIR}/{group_id}/{shard}" for shard in sorted(os.listdir(group_dir))
+                                 if shard.endswith(".jsonl"))
+        return documents
+
+    @deprecated("Use _load_or_rebuild_partitions() instead")
     def _load_vector_store(self) -> FAISS:
         if os.path.exists(f"{self.docs_dir}/index"):
             return FAISS.load_local(
@@ -166,9 +462,9 @@ class RAGService:
         vector_store.save_local(f"{self.docs_dir}/index")
         return vector_store
 
-    def add_document(self, content: str, filename: str) -> None:
-        """新增文档"""
-        if not filename.endswith(".txt"):
+    def add_document(self, content: str, filename: str) -> Future:
+        """新增文档（未带受支持的扩展名时按 .txt 保存），索引在后台更新，返回的 Future 在更新完成后给出变更统计"""
+        if document_format(filename) is None:
             filename = f"{filename}.txt"
 
         file_path = os.path.join(self.docs_dir, filename)
@@ -176,60 +472,107 @@ class RAGService:
         with open(file_path, "w", encoding="utf-8") as file:
             file.write(content)
 
-        self.check_and_update_documents()
+        return self.schedule_update()
 
     def delete_document(self, filename: str) -> bool:
-        if not filename.endswith(".txt"):
+        if document_format(filename) is None:
             filename = f"{filename}.txt"
 
         file_path = os.path.join(self.docs_dir, filename)
 
         if os.path.exists(file_path):
             os.remove(file_path)
-            self.check_and_update_documents()
+            self.schedule_update()
             return True
         return False
 
+    def _scan_stats(self) -> Dict[str, Tuple[int, int, int]]:
+        """文档的 (大小, 修改时间, inode)，用于低成本地判断是否需要检查变更"""
+        stats = {}
+        for doc_name in self._get_all_documents():
+            try:
+                st = os.stat(os.path.join(self.docs_dir, doc_name))
+            except FileNotFoundError:
+                continue
+            stats[doc_name] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return stats
+
+    def start_watcher(self, interval: float) -> None:
+        """启动后台线程，每隔 interval 秒扫描一次文档 stat，发生变化时更新索引"""
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, args=(interval,), name="rag-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._watcher_stop.set()
+        self._watcher = None
+
+    def close(self) -> None:
+        """停止文档监视与后台索引线程（等待进行中的更新完成）"""
+        self.stop_watcher()
+        self._indexer.shutdown(wait=True)
+
+    def _watch_loop(self, interval: float) -> None:
+        while not self._watcher_stop.wait(interval):
+            try:
+                if self._scan_stats() != self._stat_snapshot:
+                    self.schedule_update()
+            except Exception as e:
+                logger.warn("RAG", f"文档监视扫描失败: {e}")
+
+    def schedule_update(self) -> Future:
+        """
+        将索引更新交给后台索引线程，立即返回 Future（结果为变更统计）。
+        已有尚未开始的更新时直接复用，多次文档变更合并为一次构建
+        """
+        with self._job_lock:
+            if self._queued_update is None:
+                self._queued_update = self._indexer.submit(self._run_update)
+                if self._progress["state"] == "idle":
+                    self._progress["state"] = "queued"
+            return self._queued_update
+
+    def _run_update(self) -> Dict[str, int]:
+        with self._job_lock:
+            self._queued_update = None
+        self._set_progress(state="running", stage="scan", done=0, total=0, started_at=time.time(), error=None)
+        try:
+            changes = self._check_and_update_documents()
+            if any(changes.values()):
+                logger.info("RAG", f"检测到文档变更并已更新索引: {changes}")
+            self._set_progress(changes=changes)
+            return changes
+        except Exception as e:
+            logger.warn("RAG", f"后台更新索引失败: {e}")
+            self._set_progress(error=str(e))
+            raise
+        finally:
+            with self._job_lock:
+                state = "queued" if self._queued_update is not None else "idle"
+            self._set_progress(state=state, stage="", finished_at=time.time())
+
+    def _set_progress(self, **fields: Any) -> None:
+        with self._job_lock:
+            self._progress.update(fields)
+
+    def index_status(self) -> Dict[str, Any]:
+        """后台索引任务的状态：state（idle / queued / running）、当前阶段与进度、最近一次的变更统计或错误"""
+        with self._job_lock:
+            return dict(self._progress)
+
     def check_and_update_documents(self) -> Dict[str, int]:
         """
-        检查文档变化并增量更新向量存储
+        检查文档变化并增量更新向量存储（在后台索引线程中执行，调用方阻塞等待结果）
         返回变更统计: 新增、更新、删除的文档数量
         """
-        current_docs = self._get_all_documents()
-        previous_checksums = self.document_checksums.copy()
-
-        # 计算变化统计
-        changes = {
-            "added": 0,
-            "updated": 0,
-            "removed": 0
-        }
-
-        # 检查删除的文档
-        for doc_name in previous_checksums:
-            if doc_name not in current_docs:
-                changes["removed"] += 1
-
-        # 检查新增和更新的文档
-        for doc_name in current_docs:
-            file_path = os.path.join(self.docs_dir, doc_name)
-            current_checksum = self._calculate_checksum(file_path)
-
-            if doc_name not in previous_checksums:
-                changes["added"] += 1
-            elif previous_checksums[doc_name] != current_checksum:
-                changes["updated"] += 1
-
-        # 如果有变更，重建索引
-        if any(v > 0 for v in changes.values()):
-            # 删除旧索引
-            if os.path.exists(self.index_dir):
-                shutil.rmtree(self.index_dir)
-            # 构建新索引
-            self.vector_store = self._build_vector_store(current_docs)
-            # 更新校验和
-            self._save_checksums()
+        return self.schedule_update().result()
 
+    def _check_and_update_documents(self) -> Dict[str, int]:
+        snapshot = self._scan_stats()
+        changes = self._sync_documents(snapshot)
+        self._stat_snapshot = snapshot
         return changes
 
     @staticmethod
@@ -239,9 +582,8 @@ class RAGService:
         doc.metadata["file_name"] = file_name
         return doc
 
-    def query(self, question: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        """查询相关文档片段"""
-        docs = self.vector_store.similarity_search(question, k=top_k)
+    @staticmethod
+    def _format(docs: List[Document]) -> List[Dict[str, Any]]:
         return [
             {
                 "content": doc.page_content,
@@ -249,28 +591,191 @@ class RAGService:
             } for doc in docs
         ]
 
+    def _search_by_vector(self, embedding: List[float], top_k: int,
+                          query_filter: Optional[Dict[str, str]] = None) -> List[Document]:
+        """按过滤条件路由到相关分区检索，多个分区的结果按距离合并"""
+        with self._store_lock:
+            partitions, remaining = route_filter(query_filter, self.partitions)
+            scored: List[Tuple[Document, float]] = []
+            for partition in partitions:
+                scored.extend(self.partitions[partition].search(embedding, top_k, remaining))
+        if len(partitions) > 1:
+            scored.sort(key=lambda item: item[1])
+        return [doc for doc, _ in scored[:top_k]]
+
+    def _search_by_lexical(self, question: str, top_k: int, fetch_k: int,
+                           query_filter: Optional[Dict[str, str]] = None) -> Tuple[List[Document], bool]:
+        """
+        BM25 检索相关分区的 fetch_k 个候选，返回 (按得分排序的切块, 是否为强匹配)。
+        强匹配：覆盖全部（RAG_LEXICAL_STRONG_COVERAGE）查询词的切块数量足以填满结果，此时无需向量检索
+        """
+        with self._store_lock:
+            partitions, remaining = route_filter(query_filter, self.partitions)
+            available = sum(self.partitions[partition].ntotal for partition in partitions)
+            hits: List[Tuple[Document, float, float]] = []
+            for partition in partitions:
+                hits.extend(self.partitions[partition].lexical_search(question, fetch_k, remaining))
+        hits.sort(key=lambda item: item[1], reverse=True)
+        threshold = settings.RAG_LEXICAL_STRONG_COVERAGE
+        strong_docs = [doc for doc, _, coverage in hits if coverage >= threshold]
+        if strong_docs and len(strong_docs) >= min(top_k, available):
+            return strong_docs, True
+        return [doc for doc, _, _ in hits], False
+
+    @staticmethod
+    def _fuse(vector_docs: List[Document], lexical_docs: List[Document], top_k: int) -> List[Document]:
+        docs = {doc.id: doc for doc in lexical_docs + vector_docs}
+        ranking = reciprocal_rank_fusion([[doc.id for doc in vector_docs], [doc.id for doc in lexical_docs]],
+                                         k=settings.RAG_RRF_K)
+        return [docs[chunk_id] for chunk_id in ranking[:top_k]]
+
+    def _result_key(self, question: str, top_k: int, query_filter: Optional[Dict[str, str]]) -> Tuple:
+        filter_key = tuple(sorted(query_filter.items())) if query_filter else ()
+        return normalize_query(question), filter_key, top_k, self.index_version
+
+    def _query(self, question: str, top_k: int, query_filter: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        if not self.partitions:
+            return []
+        key = self._result_key(question, top_k, query_filter)
+        results = self.result_cache.get(key)
+        if results is None:
+            lexical_docs, strong = self._lexical_stage(question, top_k, query_filter)
+            if strong:
+                results = self._format(lexical_docs[:top_k])
+            else:
+                embedding = self.query_embedding_cache.get(key[0])
+                if embedding is None:
+                    embedding = self.embeddings.embed_query(question)
+                    self.query_embedding_cache.put(key[0], embedding)
+                results = self._vector_stage(embedding, lexical_docs, top_k, query_filter)
+            self.result_cache.put(key, results)
+        return list(results)
+
+    async def _aquery(self, question: str, top_k: int,
+                      query_filter: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        if not self.partitions:
+            return []
+        key = self._result_key(question, top_k, query_filter)
+        results = self.result_cache.get(key)
+        if results is None:
+            lexical_docs, strong = await asyncio.to_thread(self._lexical_stage, question, top_k, query_filter)
+            if strong:
+                results = self._format(lexical_docs[:top_k])
+            else:
+                embedding = self.query_embedding_cache.get(key[0])
+                if embedding is None:
+                    embedding = await self.embeddings.aembed_query(question)
+                    self.query_embedding_cache.put(key[0], embedding)
+                results = await asyncio.to_thread(self._vector_stage, embedding, lexical_docs, top_k, query_filter)
+            self.result_cache.put(key, results)
+        return list(results)
+
+    def _lexical_stage(self, question: str, top_k: int,
+                       query_filter: Optional[Dict[str, str]]) -> Tuple[List[Document], bool]:
+        if not settings.RAG_HYBRID_ENABLED:
+            return [], False
+        lexical_docs, strong = self._search_by_lexical(question, top_k, top_k * settings.RAG_HYBRID_FETCH_FACTOR,
+                                                       query_filter)
+        if strong:
+            self.lexical_shortcuts += 1
+        return lexical_docs, strong
+
+    def _vector_stage(self, embedding: List[float], lexical_docs: List[Document], top_k: int,
+                      query_filter: Optional[Dict[str, str]]) -> List[Dict[str, Any]]:
+        if not settings.RAG_HYBRID_ENABLED:
+            return self._format(self._search_by_vector(embedding, top_k, query_filter))
+        vector_docs = self._search_by_vector(embedding, top_k * settings.RAG_HYBRID_FETCH_FACTOR, query_filter)
+        return self._format(self._fuse(vector_docs, lexical_docs, top_k))
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """查询向量缓存与检索结果缓存的命中统计，以及仅靠倒排索引完成的查询次数"""
+        return {
+            "embedding": self.query_embedding_cache.snapshot(),
+            "result": self.result_cache.snapshot(),
+            "index_version": self.index_version,
+            "lexical_shortcuts": self.lexical_shortcuts,
+        }
+
+    def query(self, question: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """查询相关文档片段"""
+        return self._query(question, top_k)
+
     def query_with_filter(self, question: str, query_filter: Dict[str, str], top_k: int = 10) -> List[Dict[str, Any]]:
-        docs = self.vector_store.similarity_search(question, k=top_k, filter=query_filter)
-        return [
-            {
-                "content": doc.page_content,
-                "metadata": doc.metadata
-            } for doc in docs
-        ]
+        return self._query(question, top_k, query_filter)
 
-    def query_for_memory(self, question: str, top_k: int = 10) -> List[Dict[str, Any]]:
-        query_results = self.query_with_filter(
+    def query_for_memory(self, question: str, top_k: int = 10, group_id: Optional[str] = None,
+                         date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        candidates = self.query_with_filter(
+            question,
+            query_filter=self._memory_filter(group_id, date_from, date_to),
+            top_k=top_k * settings.RAG_HYBRID_FETCH_FACTOR
+        )
+        return self._decay_rank(candidates, top_k)
+
+    @staticmethod
+    def _memory_filter(group_id: Optional[str], date_from: Optional[str] = None,
+                       date_to: Optional[str] = None) -> Dict[str, str]:
+        """
+        指定群号时只检索该群的记忆分区，否则检索全部记忆分区；
+        未指定起始日期时只检索最近 RAG_MEMORY_DEFAULT_MONTHS 个月的分片，使检索耗时不随历史增长
+        """
+        query_filter = {"file_name": MEMORY_FILE}
+        if group_id is not None:
+            query_filter["group_id"] = str(group_id)
+        if date_from is None and settings.RAG_MEMORY_DEFAULT_MONTHS > 0:
+            today = datetime.now()
+            month_index = today.year * 12 + today.month - settings.RAG_MEMORY_DEFAULT_MONTHS
+            date_from = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01"
+        if date_from:
+            query_filter["date_from"] = date_from
+        if date_to:
+            query_filter["date_to"] = date_to
+        return query_filter
+
+    @staticmethod
+    def _decay_rank(candidates: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        时间衰减排序：得分 = 相关度 1/(1+名次) × (下限 + (1-下限) × 0.5^(距今天数/半衰期))，
+        越久远的记忆越靠后，但相关度足够高时仍能排在前面
+        """
+        half_life = settings.RAG_MEMORY_HALF_LIFE_DAYS
+        if half_life <= 0:
+            return candidates[:top_k]
+        floor = settings.RAG_MEMORY_DECAY_FLOOR
+        today = datetime.now().date()
+
+        def score(item: Tuple[int, Dict[str, Any]]) -> float:
+            rank, candidate = item
+            try:
+                age = max(0, (today - datetime.strptime(candidate["metadata"]["date"], "%Y-%m-%d").date()).days)
+            except (KeyError, ValueError):
+                age = 0
+            return (floor + (1 - floor) * 0.5 ** (age / half_life)) / (1 + rank)
+
+        ranked = sorted(enumerate(candidates), key=score, reverse=True)
+        return [candidate for _, candidate in ranked[:top_k]]
+
+    async def aquery(self, question: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """query 的异步版本：查询向量经合并请求获取，检索在线程中执行，不阻塞事件循环"""
+        return await self._aquery(question, top_k)
+
+    async def aquery_with_filter(self, question: str, query_filter: Dict[str, str],
+                                 top_k: int = 10) -> List[Dict[str, Any]]:
+        return await self._aquery(question, top_k, query_filter)
+
+    async def aquery_for_memory(self, question: str, top_k: int = 10, group_id: Optional[str] = None,
+                                date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        candidates = await self.aquery_with_filter(
             question,
-            query_filter={
-                "file_name": "daily_memory.txt"
-            },
-            top_k=top_k
+            query_filter=self._memory_filter(group_id, date_from, date_to),
+            top_k=top_k * settings.RAG_HYBRID_FETCH_FACTOR
         )
-        return query_results
+        return self._decay_rank(candidates, top_k)
 
 
 if __name__ == "__main__":
     rag_service = RAGService("../../rag_docs")
+    rag_service.check_and_update_documents()
 
     # 测试查询功能
     test_queries = [
@@ -0,0 +1,468 @@
+import json
+import math
+import mmap
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from infra.config.settings import settings
+from infra.logger import logger
+from .lexical import LexicalIndex
+
+INDEX_FLAT = "flat"
+INDEX_HNSW = "hnsw"
+INDEX_IVF_FLAT = "ivf_flat"
+INDEX_IVF_PQ = "ivf_pq"
+# 按规模从小到大排列，用于判断是否需要升级索引类型
+INDEX_TYPES = [INDEX_FLAT, INDEX_HNSW, INDEX_IVF_FLAT, INDEX_IVF_PQ]
+
+# 向量压缩方式：不压缩 / 半精度 / 8 位标量量化 / 乘积量化
+QUANT_NONE = "none"
+QUANT_FP16 = "fp16"
+QUANT_SQ8 = "sq8"
+QUANT_PQ = "pq"
+QUANTIZATIONS = [QUANT_NONE, QUANT_FP16, QUANT_SQ8, QUANT_PQ]
+# 需要训练的压缩方式，分区规模翻倍后重新训练，避免早期样本过少导致的量化误差
+_TRAINED_QUANTIZATIONS = (QUANT_SQ8, QUANT_PQ)
+
+# 8 位乘积量化每个子空间训练 256 个聚类中心，每个中心至少需要 39 个样本
+_PQ_MIN_TRAIN = 256 * 39
+
+# 索引布局：(索引类型, 压缩方式, PCA 维度)
+Layout = Tuple[str, str, int]
+
+
+def choose_index_type(size: int) -> str:
+    """RAG_INDEX_TYPE 为 auto 时按分区规模选择索引类型：小规模精确检索，中等规模 HNSW，大规模 IVF，超大规模 IVF-PQ"""
+    if settings.RAG_INDEX_TYPE != "auto":
+        return settings.RAG_INDEX_TYPE
+    if size >= settings.RAG_IVF_PQ_MIN_SIZE:
+        return INDEX_IVF_PQ
+    if size >= settings.RAG_IVF_MIN_SIZE:
+        return INDEX_IVF_FLAT
+    if size >= settings.RAG_HNSW_MIN_SIZE:
+        return INDEX_HNSW
+    return INDEX_FLAT
+
+
+def choose_layout(size: int, dim: int, quantization: str = QUANT_NONE, pca_dim: int = 0,
+                  index_type: Optional[str] = None) -> Layout:
+    """
+    按分区规模确定实际可用的索引布局：规模未达到 RAG_QUANTIZE_MIN_SIZE 时不压缩，
+    训练样本不足时退回到不需要（或需要更少）训练的索引类型与压缩方式
+    """
+    index_type = index_type or choose_index_type(size)
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"不支持的压缩方式: {quantization}")
+    if size < settings.RAG_QUANTIZE_MIN_SIZE:
+        quantization, pca_dim = QUANT_NONE, 0
+    # PCA 需要不少于目标维度的训练样本
+    if pca_dim >= dim or size < pca_dim:
+        pca_dim = 0
+    if index_type == INDEX_IVF_PQ and size < _PQ_MIN_TRAIN:
+        index_type = INDEX_IVF_FLAT
+    if index_type == INDEX_IVF_FLAT and size < 39:
+        index_type = INDEX_FLAT
+    if index_type == INDEX_IVF_PQ:
+        quantization = QUANT_PQ
+    if quantization == QUANT_PQ and size < _PQ_MIN_TRAIN:
+        quantization = QUANT_SQ8
+    return index_type, quantization, pca_dim
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # 子向量不少于 8 维，过短的子向量量化收益低且训练开销大
+    for m in (64, 48, 32, 24, 16, 8, 4):
+        if dim % m == 0 and dim // m >= 8:
+            return m
+    return 1
+
+
+def _encoding(quantization: str, dim: int) -> str:
+    return {
+        QUANT_NONE: "Flat",
+        QUANT_FP16: "SQfp16",
+        QUANT_SQ8: "SQ8",
+        QUANT_PQ: f"PQ{_pq_subquantizers(dim)}x8",
+    }[quantization]
+
+
+def build_index(index_type: str, dim: int, train_vectors: np.ndarray,
+                quantization: str = QUANT_NONE, pca_dim: int = 0) -> faiss.Index:
+    """
+    构建支持自定义 int64 ID 的空索引，需要训练的部分（IVF 聚类、量化器、PCA）在 train_vectors 上训练；
+    IVF 类索引启用哈希直接映射（支持按ID删除与重建）。布局应先经 choose_layout 校验
+    """
+    size = len(train_vectors)
+    prefix = f"PCA{pca_dim}," if pca_dim else ""
+    work_dim = pca_dim or dim
+    if index_type in (INDEX_IVF_FLAT, INDEX_IVF_PQ):
+        # 聚类中心数取 4*sqrt(n)，并保证每个中心至少有 39 个训练样本
+        nlist = max(1, min(int(4 * math.sqrt(size)), size // 39))
+        index = faiss.index_factory(dim, f"{prefix}IVF{nlist},{_encoding(quantization, work_dim)}")
+        index.train(train_vectors)
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    if index_type == INDEX_HNSW:
+        if quantization == QUANT_NONE:
+            body = "HNSW32"
+        elif quantization == QUANT_PQ:
+            body = f"HNSW32_PQ{_pq_subquantizers(work_dim)}"
+        else:
+            body = f"HNSW32,{_encoding(quantization, work_dim)}"
+    elif index_type == INDEX_FLAT:
+        body = _encoding(quantization, work_dim)
+    else:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+    index = faiss.IndexIDMap2(faiss.index_factory(dim, prefix + body))
+    if not index.is_trained:
+        index.train(train_vectors)
+    return index
+
+
+def _tune(index: faiss.Index, index_type: str) -> None:
+    params = faiss.ParameterSpace()
+    if index_type == INDEX_HNSW:
+        params.set_index_parameter(index, "efSearch", settings.RAG_HNSW_EF_SEARCH)
+    elif index_type in (INDEX_IVF_FLAT, INDEX_IVF_PQ):
+        params.set_index_parameter(index, "nprobe", settings.RAG_IVF_NPROBE)
+
+
+def _match(metadata: Dict[str, Any], query_filter: Dict[str, Any]) -> bool:
+    for key, value in query_filter.items():
+        # 日期范围（YYYY-MM-DD，闭区间）
+        if key == "date_from":
+            if metadata.get("date", "") < value:
+                return False
+        elif key == "date_to":
+            if metadata.get("date", "") > value:
+                return False
+        elif isinstance(value, list):
+            if metadata.get(key) not in value:
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+class CompactDocstore:
+    """
+    紧凑的切块存储，替代 pickle：
+        texts.bin     所有切块文本按 UTF-8 顺序拼接，查询命中时按偏移量通过内存映射按需读取
+        docstore.json 切块ID -> [向量ID, 偏移, 长度, 元数据]，以及索引布局、训练样本数和下一个向量ID
+    只有文本按需读取；docstore.json 在加载时完整读入内存，加载耗时与常驻内存随切块数线性增长。
+    删除的文本在无效字节超过有效字节时整体压缩
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.texts_file = os.path.join(path, "texts.bin")
+        self.meta_file = os.path.join(path, "docstore.json")
+        self.entries: Dict[str, List[Any]] = {}
+        self.id_to_chunk: Dict[int, str] = {}
+        self.next_id = 0
+        self.index_type = ""
+        self.quantization = QUANT_NONE
+        self.pca_dim = 0
+        self.trained_size = 0
+        self._pending: Dict[str, str] = {}  # 尚未写入 texts.bin 的文本
+        self._mmap: Optional[mmap.mmap] = None
+        self._file = None
+
+    def load(self) -> None:
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.entries = data["entries"]
+        self.next_id = data["next_id"]
+        self.index_type = data["index_type"]
+        self.quantization = data.get("quantization", QUANT_NONE)
+        self.pca_dim = data.get("pca_dim", 0)
+        self.trained_size = data.get("trained_size", 0)
+        self.id_to_chunk = {entry[0]: chunk_id for chunk_id, entry in self.entries.items()}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.entries
+
+    def add(self, documents: List[Document]) -> np.ndarray:
+        """登记新切块并分配向量ID"""
+        ids = []
+        for document in documents:
+            vector_id = self.next_id
+            self.next_id += 1
+            self.entries[document.id] = [vector_id, -1, 0, document.metadata]
+            self.id_to_chunk[vector_id] = document.id
+            self._pending[document.id] = document.page_content
+            ids.append(vector_id)
+        return np.asarray(ids, dtype=np.int64)
+
+    def delete(self, chunk_ids: List[str]) -> np.ndarray:
+        ids = []
+        for chunk_id in chunk_ids:
+            entry = self.entries.pop(chunk_id, None)
+            if entry is None:
+                continue
+            self.id_to_chunk.pop(entry[0], None)
+            self._pending.pop(chunk_id, None)
+            ids.append(entry[0])
+        return np.asarray(ids, dtype=np.int64)
+
+    def vector_ids(self) -> np.ndarray:
+        return np.asarray([entry[0] for entry in self.entries.values()], dtype=np.int64)
+
+    def chunk_of(self, vector_id: int) -> Optional[str]:
+        return self.id_to_chunk.get(int(vector_id))
+
+    def metadata(self, chunk_id: str) -> Dict[str, Any]:
+        return self.entries[chunk_id][3]
+
+    def text(self, chunk_id: str) -> str:
+        if chunk_id in self._pending:
+            return self._pending[chunk_id]
+        _, offset, length, _ = self.entries[chunk_id]
+        if self._mmap is None:
+            self._file = open(self.texts_file, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[offset:offset + length].decode("utf-8")
+
+    def document(self, chunk_id: str) -> Document:
+        return Document(id=chunk_id, page_content=self.text(chunk_id), metadata=self.metadata(chunk_id))
+
+    def relocate(self, path: str) -> None:
+        """分区目录被整体移动后更新文件路径；已打开的内存映射仍指向原文件，不受影响"""
+        self.path = path
+        self.texts_file = os.path.join(path, "texts.bin")
+        self.meta_file = os.path.join(path, "docstore.json")
+
+    def _close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
+
+    def save(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        size = os.path.getsize(self.texts_file) if os.path.exists(self.texts_file) else 0
+        live = sum(entry[2] for chunk_id, entry in self.entries.items() if chunk_id not in self._pending)
+        if size - live > max(live, 1 << 20):
+            self._compact()
+        elif self._pending:
+            # 关闭映射后再追加（部分平台不允许向已映射的文件写入）
+            self._close()
+            with open(self.texts_file, "ab") as f:
+                offset = f.tell()
+                for chunk_id, text in self._pending.items():
+                    data = text.encode("utf-8")
+                    f.write(data)
+                    self.entries[chunk_id][1:3] = [offset, len(data)]
+                    offset += len(data)
+            self._pending.clear()
+
+        tmp_file = f"{self.meta_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"index_type": self.index_type, "quantization": self.quantization, "pca_dim": self.pca_dim,
+                       "trained_size": self.trained_size, "next_id": self.next_id, "entries": self.entries},
+                      f, ensure_ascii=False)
+        os.replace(tmp_file, self.meta_file)
+
+    def _compact(self) -> None:
+        texts = {chunk_id: self.text(chunk_id) for chunk_id in self.entries}
+        self._close()
+        tmp_file = f"{self.texts_file}.tmp"
+        with open(tmp_file, "wb") as f:
+            offset = 0
+            for chunk_id, text in texts.items():
+                data = text.encode("utf-8")
+                f.write(data)
+                self.entries[chunk_id][1:3] = [offset, len(data)]
+                offset += len(data)
+        os.replace(tmp_file, self.texts_file)
+        self._pending.clear()
+
+
+class PartitionIndex:
+    """
+    单个分区的索引：faiss 向量索引（类型按规模自动选择，可按分区配置量化压缩与 PCA 降维）+ BM25 倒排索引 + 紧凑切块存储。
+    索引文件较大时以内存映射方式只读加载，首次修改前再完整读入内存；切块元数据与倒排索引（lexical.json）
+    在加载时完整读入内存
+    """
+
+    def __init__(self, path: str, quantization: str = QUANT_NONE, pca_dim: int = 0):
+        self.path = path
+        self.index_file = os.path.join(path, "index.faiss")
+        self.docstore = CompactDocstore(path)
+        self.lexical = LexicalIndex(path)
+        self.index: Optional[faiss.Index] = None
+        self.mmapped = False
+        # 配置的压缩方式，实际布局由 choose_layout 按规模决定并记录在切块存储中
+        self.quantization = quantization
+        self.pca_dim = pca_dim
+
+    @classmethod
+    def load(cls, path: str, quantization: str = QUANT_NONE, pca_dim: int = 0) -> "PartitionIndex":
+        partition = cls(path, quantization, pca_dim)
+        partition.docstore.load()
+        mmap_min = settings.RAG_INDEX_MMAP_MIN_MB * 1024 * 1024
+        if os.path.getsize(partition.index_file) >= mmap_min > 0:
+            partition.index = faiss.read_index(partition.index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            partition.mmapped = True
+        else:
+            partition.index = faiss.read_index(partition.index_file)
+        _tune(partition.index, partition.index_type)
+        if not partition.lexical.load():
+            # 旧版分区没有倒排索引，由切块文本补建
+            for chunk_id in partition.docstore.entries:
+                partition.lexical.add(chunk_id, partition.docstore.text(chunk_id))
+            partition.lexical.save()
+        # 压缩配置变更后按新布局重建
+        target = partition._target_layout(partition.ntotal, partition.index.d)
+        if partition.ntotal and target[1:] != partition.layout[1:]:
+            partition._ensure_writable()
+            ids, vectors = partition._reconstruct_all(partition.index.d)
+            partition._rebuild(target, ids, vectors)
+            partition.save()
+        return partition
+
+    @property
+    def index_type(self) -> str:
+        return self.docstore.index_type
+
+    @property
+    def layout(self) -> Layout:
+        return self.docstore.index_type, self.docstore.quantization, self.docstore.pca_dim
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.docstore)
+
+    def _target_layout(self, size: int, dim: int) -> Layout:
+        index_type = choose_index_type(size)
+        # 索引类型只升级不降级，删除后规模回落时沿用当前类型
+        if self.index_type and INDEX_TYPES.index(index_type) < INDEX_TYPES.index(self.index_type):
+            index_type = self.index_type
+        return choose_layout(size, dim, self.quantization, self.pca_dim, index_type)
+
+    def _needs_retrain(self, size: int) -> bool:
+        trained = self.docstore.quantization in _TRAINED_QUANTIZATIONS or self.docstore.pca_dim
+        return bool(trained) and size >= 2 * self.docstore.trained_size
+
+    def _ensure_writable(self) -> None:
+        if self.mmapped:
+            self.index = faiss.read_index(self.index_file)
+            _tune(self.index, self.index_type)
+            self.mmapped = False
+
+    def _reconstruct_all(self, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+        """取回全部向量用于重建；量化索引取回的是解码后的近似向量"""
+        ids = self.docstore.vector_ids()
+        if self.index is None or not len(ids):
+            return np.empty(0, dtype=np.int64), np.empty((0, dim), dtype=np.float32)
+        return ids, self.index.reconstruct_batch(ids)
+
+    def _rebuild(self, layout: Layout, ids: np.ndarray, vectors: np.ndarray) -> None:
+        index_type, quantization, pca_dim = choose_layout(len(vectors), vectors.shape[1], *layout[1:], layout[0])
+        index = build_index(index_type, vectors.shape[1], vectors, quantization, pca_dim)
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+        _tune(index, index_type)
+        layout = (index_type, quantization, pca_dim)
+        if self.index_type and self.layout != layout:
+            logger.info("RAG", f"分区 {os.path.basename(self.path)} 规模 {len(ids)}，索引布局 {self.layout} -> {layout}")
+        self.index = index
+        self.docstore.index_type, self.docstore.quantization, self.docstore.pca_dim = layout
+        self.docstore.trained_size = len(vectors)
+        self.mmapped = False
+
+    def add(self, documents: List[Document], vectors: List[List[float]]) -> None:
+        if not documents:
+            return
+        self.delete([document.id for document in documents if document.id in self.docstore])
+        self._ensure_writable()
+        array = np.asarray(vectors, dtype=np.float32)
+        size = self.ntotal + len(documents)
+        target = self._target_layout(size, array.shape[1])
+        if self.index is None or target != self.layout or self._needs_retrain(size):
+            # 新建分区、规模跨过阈值或量化器训练样本已过时，用全部向量（重新）训练并构建更合适的索引
+            old_ids, old_vectors = self._reconstruct_all(array.shape[1])
+            ids = self.docstore.add(documents)
+            self._rebuild(target, np.concatenate([old_ids, ids]), np.concatenate([old_vectors, array]))
+        else:
+            self.index.add_with_ids(array, self.docstore.add(documents))
+        for document in documents:
+            self.lexical.add(document.id, document.page_content)
+
+    def delete(self, chunk_ids: List[str]) -> None:
+        chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in self.docstore]
+        if not chunk_ids or self.index is None:
+            return
+        self._ensure_writable()
+        for chunk_id in chunk_ids:
+            self.lexical.remove(chunk_id)
+        if self.index_type == INDEX_HNSW:
+            # HNSW 不支持按ID删除，用剩余向量重建
+            self.docstore.delete(chunk_ids)
+            ids, vectors = self._reconstruct_all(self.index.d)
+            self._rebuild(self.layout, ids, vectors)
+        else:
+            self.index.remove_ids(self.docstore.delete(chunk_ids))
+
+    def search(self, vector: List[float], k: int,
+               query_filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        """返回 (切块, L2 距离) 列表；有过滤条件时逐步扩大候选数，直到凑满 k 个或检索完全部向量"""
+        total = self.ntotal
+        if self.index is None or total == 0:
+            return []
+        query = np.asarray([vector], dtype=np.float32)
+        fetch = k if not query_filter else max(k * 4, 20)
+        while True:
+            distances, ids = self.index.search(query, min(fetch, total))
+            hits = []
+            for distance, vector_id in zip(distances[0], ids[0]):
+                chunk_id = self.docstore.chunk_of(vector_id) if vector_id >= 0 else None
+                if chunk_id is None or (query_filter and not _match(self.docstore.metadata(chunk_id), query_filter)):
+                    continue
+                hits.append((chunk_id, float(distance)))
+                if len(hits) >= k:
+                    break
+            if len(hits) >= k or not query_filter or fetch >= total:
+                break
+            fetch *= 2
+        return [(self.docstore.document(chunk_id), distance) for chunk_id, distance in hits]
+
+    def lexical_search(self, query: str, k: int,
+                       query_filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float, float]]:
+        """BM25 检索，返回 (切块, 得分, 查询词覆盖率) 列表"""
+        hits = []
+        for chunk_id, score, coverage in self.lexical.search(query):
+            if query_filter and not _match(self.docstore.metadata(chunk_id), query_filter):
+                continue
+            hits.append((self.docstore.document(chunk_id), score, coverage))
+            if len(hits) >= k:
+                break
+        return hits
+
+    def move_to(self, path: str) -> None:
+        """将分区目录整体重命名为 path（目标需不存在且位于同一文件系统）"""
+        os.replace(self.path, path)
+        self.path = path
+        self.index_file = os.path.join(path, "index.faiss")
+        self.docstore.relocate(path)
+        self.lexical.file = os.path.join(path, "lexical.json")
+
+    def close(self) -> None:
+        self.docstore._close()
+
+    def save(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        if not self.mmapped:
+            tmp_file = f"{self.index_file}.tmp"
+            faiss.write_index(self.index, tmp_file)
+            os.replace(tmp_file, self.index_file)
+        self.docstore.save()
+        self.lexical.save()
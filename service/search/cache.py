@@ -0,0 +1,105 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from infra.logger import logger
+from .models import WebPageValue
+
+_SPACE_RE = re.compile(r"\s+")
+_EDGE_PUNCT = " \t\r\n?？!！。.,，、;；:：\"'“”‘’"
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询：全角转半角、统一小写、合并空白、去掉首尾标点"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return _SPACE_RE.sub(" ", query).strip(_EDGE_PUNCT)
+
+
+class SearchCache:
+    """
+    联网搜索结果缓存：按 时效范围 + 归一化查询 保存最近一次的结果与条数，持久化到本地。
+    条数不少于请求条数的缓存可以直接截取使用；过期条目保留到 stale_ttl，余额不足或接口失败时作为兜底。
+    搜索本身是低频的付费调用，每次写入都立即保存
+    """
+
+    def __init__(self, json_file: str = "cache/search_cache.json", ttl: float = 3600, stale_ttl: float = 7 * 86400,
+                 max_entries: int = 500):
+        self.json_file = json_file
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = self.load_entries(json_file)
+
+    @staticmethod
+    def load_entries(json_file: str) -> Dict[str, Dict]:
+        if not os.path.exists(json_file):
+            return {}
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warn("Web Search", f"搜索缓存读取失败: {e}")
+            return {}
+
+    def save_entries(self) -> None:
+        with self._lock:
+            snapshot = json.dumps(self.entries, ensure_ascii=False)
+        try:
+            os.makedirs(os.path.dirname(self.json_file), exist_ok=True)
+            tmp_file = f"{self.json_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp_file, self.json_file)
+        except Exception as e:
+            logger.warn("Web Search", f"保存搜索缓存失败: {e}")
+
+    @staticmethod
+    def key(query: str, freshness: str) -> str:
+        return f"{freshness}|{normalize_query(query)}"
+
+    def get(self, query: str, count: int, freshness: str,
+            allow_stale: bool = False) -> Optional[Tuple[List[WebPageValue], float]]:
+        """
+        返回 (结果, 缓存时长秒)；没有可用缓存时返回 None。
+        缓存条数少于请求条数时，只有当时接口返回的结果已不足缓存条数（即已取完）才可使用
+        """
+        with self._lock:
+            entry = self.entries.get(self.key(query, freshness))
+        if entry is None:
+            return None
+        age = time.time() - entry["time"]
+        if age > (self.stale_ttl if allow_stale else self.ttl):
+            return None
+        results = entry["results"]
+        if entry["count"] < count and len(results) >= entry["count"]:
+            return None
+        return [WebPageValue(**item) for item in results[:count]], age
+
+    def put(self, query: str, count: int, freshness: str, results: List[WebPageValue]) -> None:
+        key = self.key(query, freshness)
+        with self._lock:
+            entry = self.entries.get(key)
+            # 条数更多的新鲜缓存可以覆盖更少条数的请求，不用更少的结果替换它
+            if entry and entry["count"] > count and time.time() - entry["time"] <= self.ttl:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = {
+                "count": count,
+                "time": time.time(),
+                "results": [item.model_dump() for item in results],
+            }
+            self._prune()
+        self.save_entries()
+
+    def _prune(self) -> None:
+        now = time.time()
+        for key in [k for k, entry in self.entries.items() if now - entry["time"] > self.stale_ttl]:
+            del self.entries[key]
+        # 字典按写入顺序排列，超出容量时淘汰最早写入的条目
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
@@ -3,6 +3,7 @@ import asyncio
 import httpx
 
 from infra.config.settings import settings
+from infra.http import create_client
 from infra.logger import logger
 from .models import SearchRequest, SearchResponse
 
@@ -12,27 +13,27 @@ class SearchClient:
     def __init__(self):
         self.host = settings.WEB_SEARCH_URL
         self.api_key = settings.WEB_SEARCH_API_KEY
-        self.client = httpx.AsyncClient(
+        self.client = create_client(
             headers={"Authorization": f"Bearer {self.api_key}",
                      "Content-Type": "application/json"},
             base_url=self.host,
             timeout=httpx.Timeout(10),
         )
 
-    async def search(self, query: str, count: int = 10) -> SearchResponse | None:
+    async def search(self, query: str, count: int = 10, freshness: str = "noLimit") -> SearchResponse | None:
         url = "/v1/web-search"
-        searchRequest = SearchRequest(query=query, count=(str(count)))
+        searchRequest = SearchRequest(query=query, count=(str(count)), freshness=freshness)
         payload = searchRequest.model_dump()
 
         try:
             response = await self.client.post(url=url, json=payload)
-        except httpx.TimeoutException:
-            logger.warn("Web Search", "Timeout")
+        except httpx.TransportError as e:
+            logger.warn("Web Search", f"Search Request Failed: {type(e).__name__}")
             return None
 
         if response.status_code != 200:
             logger.warn("Web Search", f"Search Request failed. Code: "
-                                      f"{response.status_code} Message: {response.json().get("msg")}")
+                                      f"{response.status_code} Message: {response.json().get('msg')}")
             return None
 
         data = response.json()
@@ -43,7 +44,11 @@ class SearchClient:
     async def fund_remaining(self) -> float | None:
         url = "/v1/fund/remaining"
 
-        response = await self.client.get(url=url)
+        try:
+            response = await self.client.get(url=url)
+        except httpx.TransportError as e:
+            logger.warn("Web Search", f"Remaining Request Failed: {type(e).__name__}")
+            return None
 
         if response.status_code != 200:
             logger.warn("Web Search", f"Remaining Request failed. Code: {response.status_code}")
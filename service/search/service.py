@@ -1,24 +1,93 @@
-from typing import List, Optional
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
 
+from infra.config.settings import settings
+from infra.logger import logger
+from .cache import SearchCache, normalize_query
 from .client import SearchClient
 from .models import WebPageValue
 
 
 class SearchService:
+    """
+    联网搜索服务：结果先查本地缓存，并发的相同请求只调用一次接口；
+    账户余额不足或接口失败时，优先返回过期的缓存结果
+    """
+    _instance: Optional["SearchService"] = None
+
+    @classmethod
+    def shared(cls) -> "SearchService":
+        """获取长驻实例，共用 HTTP 连接与结果缓存"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
     def __init__(self):
         self.client = SearchClient()
+        self.cache: Optional[SearchCache] = SearchCache(
+            ttl=settings.WEB_SEARCH_CACHE_TTL,
+            stale_ttl=settings.WEB_SEARCH_CACHE_STALE_TTL,
+            max_entries=settings.WEB_SEARCH_CACHE_SIZE,
+        ) if settings.WEB_SEARCH_CACHE_TTL > 0 else None
+        self._inflight: Dict[Tuple[str, str, int], asyncio.Future] = {}
+        self._fund: Optional[float] = None
+        self._fund_checked = float("-inf")
+
+    async def search(self, query: str, count: int = 10, freshness: str = "noLimit") -> List[WebPageValue]:
+        if self.cache:
+            cached = self.cache.get(query, count, freshness)
+            if cached:
+                logger.debug("Web Search", f"[{query}] 命中缓存（{cached[1]:.0f}s 前）")
+                return cached[0]
+            stale = self.cache.get(query, count, freshness, allow_stale=True)
+            if stale and await self._fund_low():
+                logger.info("Web Search", f"[{query}] 余额不足 {settings.WEB_SEARCH_LOW_FUND}，使用过期缓存")
+                return stale[0]
+        else:
+            stale = None
+
+        # 相同的查询正在请求时等待同一结果，不重复计费
+        key = (freshness, normalize_query(query), count)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(query, count, freshness))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        results = await asyncio.shield(future)
+
+        if results is None:
+            if stale:
+                logger.info("Web Search", f"[{query}] 搜索失败，使用过期缓存")
+                return stale[0]
+            return []
+        return results
 
-    async def search(self, query: str, count: int = 10) -> List[WebPageValue]:
-        response = await self.client.search(query, count=count)
+    async def _fetch(self, query: str, count: int, freshness: str) -> Optional[List[WebPageValue]]:
+        """调用接口，失败时返回 None（与无结果的空列表区分）"""
+        response = await self.client.search(query, count=count, freshness=freshness)
+        if response is None:
+            return None
+        results = response.webPages.value if response.webPages and response.webPages.value else []
+        if results and self.cache:
+            self.cache.put(query, count, freshness, results)
+        return results
 
-        if response and response.webPages and response.webPages.value:
-            return response.webPages.value
-        return []
+    async def _fund_low(self) -> bool:
+        """余额是否低于阈值；余额查询结果在 WEB_SEARCH_FUND_CHECK_INTERVAL 内复用"""
+        if settings.WEB_SEARCH_LOW_FUND <= 0:
+            return False
+        if time.monotonic() - self._fund_checked >= settings.WEB_SEARCH_FUND_CHECK_INTERVAL:
+            self._fund = await self.client.fund_remaining()
+            self._fund_checked = time.monotonic()
+        return self._fund is not None and self._fund < settings.WEB_SEARCH_LOW_FUND
 
-    async def search_for_text(self, query: str, count: int = 10) -> List[str]:
-        results = await self.search(query, count=count)
+    async def search_for_text(self, query: str, count: int = 10, freshness: str = "noLimit") -> List[str]:
+        results = await self.search(query, count=count, freshness=freshness)
         # 提取所有结果中的 summary 字段，并过滤可能存在的空值
         return [result.summary for result in results if result.summary]
 
     async def get_remaining_funds(self) -> Optional[float]:
-        return await self.client.fund_remaining()
+        self._fund = await self.client.fund_remaining()
+        self._fund_checked = time.monotonic()
+        return self._fund
@@ -1,10 +1,12 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 
 import httpx
 
 from infra.config.settings import settings
+from infra.http import create_client
 from infra.logger import logger
+from .location_cache import location_cache
 from .models import Location, NowWeather, DailyForecast, WarningInfo, StormItem, StormInfo
 
 
@@ -13,49 +15,60 @@ class QWeatherClient:
     def __init__(self):
         self.api_host = settings.WEATHER_API_HOST
         self.api_key = settings.WEATHER_API_KEY
-        self.client = httpx.AsyncClient(
-            headers={"X-QW-Api-Key": self.api_key},
-            timeout=httpx.Timeout(10, connect=5),
-        )
+        self.client = create_client(headers={"X-QW-Api-Key": self.api_key})
 
     async def get_location(self, city: str) -> Optional[Location]:
+        """解析城市名，优先使用本地缓存（包括查不到的城市名）"""
+        hit, location = location_cache.get(city)
+        if hit:
+            return location
+        found, location = await self._lookup_location(city)
+        # 只缓存明确的结果，请求失败时下次重新查询
+        if found:
+            location_cache.put(city, location)
+        return location
+
+    async def _lookup_location(self, city: str) -> Tuple[bool, Optional[Location]]:
+        """查询 GeoAPI，返回 (是否得到明确结果, 地点)；城市不存在时为 (True, None)"""
         url = f"https://{self.api_host}/geo/v2/city/lookup"
         params = {"location": city}
 
         try:
             resp = await self.client.get(url, params=params)
-        except httpx.TimeoutException:
-            logger.warn("Weather", f"[{city}] Get Loc Timeout")
-            return None
+        except httpx.TransportError as e:
+            logger.warn("Weather", f"[{city}] Get Loc Failed: {type(e).__name__}")
+            return False, None
 
+        if resp.status_code == 404:
+            return True, None
         if resp.status_code != 200:
-            print(f"[ERROR] HTTP {resp.status_code}, body: {resp.text}")
-            return None
+            logger.warn("Weather", f"[{city}] Get Loc HTTP {resp.status_code}, body: {resp.text[:200]}")
+            return False, None
 
         try:
             data = resp.json()
         except Exception as e:
-            print(f"[ERROR] JSON 解析失败: {e}, body: {resp.text[:200]}")
-            return None
+            logger.warn("Weather", f"[{city}] Get Loc JSON 解析失败: {e}, body: {resp.text[:200]}")
+            return False, None
 
         if data.get("code") == "200" and data.get("location"):
             loc = data["location"][0]
-            return Location(
+            return True, Location(
                 name=loc["name"],
                 id=loc["id"],
                 country=loc["country"],
                 adm1=loc["adm1"],
                 adm2=loc["adm2"]
             )
-        return None
+        return data.get("code") in ("200", "404"), None
 
     async def get_now_weather(self, location_id: str) -> Optional[NowWeather]:
         url = f"https://{self.api_host}/v7/weather/now"
         params = {"location": location_id}
         try:
             resp = await self.client.get(url, params=params)
-        except httpx.TimeoutException:
-            logger.warn("Weather", f"[{location_id}] Get Now Weather Timeout")
+        except httpx.TransportError as e:
+            logger.warn("Weather", f"[{location_id}] Get Now Weather Failed: {type(e).__name__}")
             return None
         data = resp.json()
         if data.get("code") == "200":
@@ -68,8 +81,8 @@ class QWeatherClient:
         params = {"location": location_id}
         try:
             resp = await self.client.get(url, params=params)
-        except httpx.TimeoutException:
-            logger.warn("Weather", f"[{location_id}] Get Forecast Weather Timeout")
+        except httpx.TransportError as e:
+            logger.warn("Weather", f"[{location_id}] Get Forecast Weather Failed: {type(e).__name__}")
             return None
         data = resp.json()
         if data.get("code") == "200":
@@ -87,8 +100,8 @@ class QWeatherClient:
         params = {"location": location_id}
         try:
             resp = await self.client.get(url, params=params)
-        except httpx.TimeoutException:
-            logger.warn("Weather", f"[{location_id}] Get Warning Timeout")
+        except httpx.TransportError as e:
+            logger.warn("Weather", f"[{location_id}] Get Warning Failed: {type(e).__name__}")
             return None
         data = resp.json()
         if data.get("code") == "200":
@@ -101,8 +114,8 @@ class QWeatherClient:
         params = {"basin": "NP", "year": year}
         try:
             resp = await self.client.get(url, params=params)
-        except httpx.TimeoutException:
-            logger.warn("Weather", f"[{year}] Get Storm List Timeout")
+        except httpx.TransportError as e:
+            logger.warn("Weather", f"[{year}] Get Storm List Failed: {type(e).__name__}")
             return None
         data = resp.json()
         if data.get("code") == "200":
@@ -119,8 +132,8 @@ class QWeatherClient:
         params = {"stormid": storm_id}
         try:
             resp = await self.client.get(url, params=params)
-        except httpx.TimeoutException:
-            logger.warn("Weather", f"Storm Id [{storm_id}] Get Storm Info Timeout")
+        except httpx.TransportError as e:
+            logger.warn("Weather", f"Storm Id [{storm_id}] Get Storm Info Failed: {type(e).__name__}")
             return None
         data = resp.json()
         if data.get("code") == "200" and data.get("now"):
@@ -0,0 +1,105 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from infra.config.settings import settings
+from infra.logger import logger
+from .models import Location
+
+_IGNORED_RE = re.compile(r"[\s·・,，。.!！?？\"'“”‘’]+")
+
+
+def normalize_city(city: str) -> str:
+    """归一化城市名：全角转半角、统一小写、去掉空白与标点"""
+    return _IGNORED_RE.sub("", unicodedata.normalize("NFKC", city).lower())
+
+
+def _aliases(location: Location) -> List[str]:
+    """同一地点的常见写法：名称、带"市"后缀、省 + 名称、市 + 名称"""
+    names = [location.name]
+    if location.adm2 == location.name and not location.name.endswith("市"):
+        names.append(f"{location.name}市")
+    if location.adm1 and location.adm1 != location.name:
+        names.append(f"{location.adm1}{location.name}")
+    if location.adm2 and location.adm2 != location.name:
+        names.append(f"{location.adm2}{location.name}")
+    return [normalize_city(name) for name in names]
+
+
+class LocationCache:
+    """
+    城市名 -> 和风天气地点 的解析缓存，按归一化的城市名保存，持久化到本地：
+    查到的地点同时登记其别名，长期有效；查不到的城市名也缓存一段较短的时间，避免反复查询
+    """
+
+    def __init__(self, json_file: str = "cache/weather_locations.json", ttl: float = 30 * 86400,
+                 negative_ttl: float = 86400):
+        self.json_file = json_file
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # 城市名 -> {"location": 地点或 None, "time": 写入时间}
+        self.entries: Dict[str, Dict] = self.load_entries(json_file)
+
+    @staticmethod
+    def load_entries(json_file: str) -> Dict[str, Dict]:
+        if not os.path.exists(json_file):
+            return {}
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warn("Weather", f"地点缓存读取失败: {e}")
+            return {}
+
+    def save_entries(self) -> None:
+        with self._lock:
+            snapshot = json.dumps(self.entries, ensure_ascii=False, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.json_file), exist_ok=True)
+            tmp_file = f"{self.json_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp_file, self.json_file)
+        except Exception as e:
+            logger.warn("Weather", f"保存地点缓存失败: {e}")
+
+    def get(self, city: str) -> Tuple[bool, Optional[Location]]:
+        """返回 (是否命中, 地点)；命中且地点为 None 表示该城市名已确认查不到"""
+        with self._lock:
+            entry = self.entries.get(normalize_city(city))
+        if entry is None:
+            return False, None
+        ttl = self.ttl if entry["location"] else self.negative_ttl
+        if time.time() - entry["time"] > ttl:
+            return False, None
+        return True, Location(**entry["location"]) if entry["location"] else None
+
+    def put(self, city: str, location: Optional[Location]) -> None:
+        now = time.time()
+        with self._lock:
+            self.entries[normalize_city(city)] = {
+                "location": location.model_dump() if location else None,
+                "time": now,
+            }
+            if location:
+                # 别名不覆盖已有的有效解析（例如同名的区县）
+                for alias in _aliases(location):
+                    entry = self.entries.get(alias)
+                    if entry is None or not entry["location"] or now - entry["time"] > self.ttl:
+                        self.entries[alias] = {"location": location.model_dump(), "time": now}
+            self._prune(now)
+        self.save_entries()
+
+    def _prune(self, now: float) -> None:
+        expired = [key for key, entry in self.entries.items()
+                   if now - entry["time"] > (self.ttl if entry["location"] else self.negative_ttl)]
+        for key in expired:
+            del self.entries[key]
+
+
+location_cache = LocationCache(ttl=settings.WEATHER_LOCATION_TTL, negative_ttl=settings.WEATHER_LOCATION_NEGATIVE_TTL)